@@ -3,10 +3,53 @@
 
 import json
 import sys
+
 import networkx as nx
-from tqdm import tqdm
+import numpy as np
+
+from graph import directed_edge_id, index_edges, read_hiking_graph
+
+
+def oriented_ele_arrays(G: nx.Graph) -> tuple[np.ndarray, np.ndarray]:
+    """Elevation gain and loss for each directed edge ID (see graph.index_edges)."""
+    num_edges = index_edges(G)
+    gain = np.zeros(2 * num_edges)
+    loss = np.zeros(2 * num_edges)
+    for _a, _b, attrs in G.edges(data=True):
+        p = attrs['feature']['properties']
+        i = 2 * attrs['eid']
+        gain[i], loss[i] = p['ele_gain'], p['ele_loss']
+        gain[i + 1], loss[i + 1] = p['ele_loss'], p['ele_gain']
+    return gain, loss
+
+
+def segment_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Sum values[offsets[i]:offsets[i+1]] for each i."""
+    totals = np.concatenate(([0.0], np.cumsum(values)))
+    return totals[offsets[1:]] - totals[offsets[:-1]]
+
+
+def segment_edges(G: nx.Graph, segments: list[tuple[int, int]]) -> list[list[int]]:
+    """Directed edge IDs along the shortest path for each (a, b) segment.
 
-from graph import read_hiking_graph
+    This runs one Dijkstra search per distinct starting node, rather than one per
+    segment. Reversed segments reuse the path in the other direction.
+    """
+    paths: dict[tuple[int, int], list[int]] = {}
+    by_source: dict[int, set[int]] = {}
+    for a, b in segments:
+        if a not in by_source.get(b, ()) and b not in by_source.get(a, ()):
+            by_source.setdefault(a, set()).add(b)
+    for a, targets in by_source.items():
+        a_paths = nx.single_source_dijkstra_path(G, a, weight='weight')
+        for b in targets:
+            paths[(a, b)] = a_paths[b]
+
+    out = []
+    for a, b in segments:
+        path = paths.get((a, b)) or paths[(b, a)][::-1]
+        out.append([directed_edge_id(G, x, y) for x, y in zip(path[:-1], path[1:])])
+    return out
 
 
 def add_ele_to_hikes(
@@ -14,42 +57,32 @@ def add_ele_to_hikes(
 ) -> list[tuple[float, float, list[int]]]:
     features = geojson['features']
     G = read_hiking_graph(features)
-    id_to_feature = {
-        f['properties']['id']: f for f in features if 'id' in f['properties']
-    }
-
-    # (a, b) -> elevation gain
-    cache: dict[tuple[int, int], float] = {}
+    gain, _loss = oriented_ele_arrays(G)
 
-    out = []
-    for d_km, seq in tqdm(hikes):
-        ele_gain = 0.0
+    # Number each distinct (a, b) segment and describe each hike as a list of them.
+    segment_ids: dict[tuple[int, int], int] = {}
+    hike_segments = []
+    for _d_km, seq in hikes:
         for a, b in zip(seq[:-1], seq[1:]):
-            up_cache = cache.get((a, b))
-            if up_cache is not None:
-                ele_gain += up_cache
-                continue
-            path = nx.shortest_path(G, a, b, weight='weight')
-            path_up = 0.0
-            path_down = 0.0
-            for node_a, node_b in zip(path[:-1], path[1:]):
-                f = G.edges[node_a, node_b]['feature']
-                p = f['properties']
-                up, down = p['ele_gain'], p['ele_loss']
-                pt_a = id_to_feature[node_a]['geometry']['coordinates']
-                pt_b = id_to_feature[node_b]['geometry']['coordinates']
-                start = f['geometry']['coordinates'][0]
-                if pt_a != start:
-                    assert pt_b == start
-                    up, down = down, up
-                path_up += up
-                path_down += down
-
-            cache[(a, b)] = path_up
-            cache[(b, a)] = path_down
-            ele_gain += path_up
-        out.append((round(d_km, 3), int(ele_gain), seq))
-    return out
+            hike_segments.append(segment_ids.setdefault((a, b), len(segment_ids)))
+    hike_offsets = np.cumsum([0] + [len(seq) - 1 for _d_km, seq in hikes])
+
+    edges_by_segment = segment_edges(G, [*segment_ids.keys()])
+    segment_offsets = np.cumsum([0] + [len(edges) for edges in edges_by_segment])
+    flat_edges = np.fromiter(
+        (e for edges in edges_by_segment for e in edges),
+        dtype=np.int64,
+        count=segment_offsets[-1],
+    )
+    segment_gain = segment_sums(gain[flat_edges], segment_offsets)
+    hike_gain = segment_sums(
+        segment_gain[np.asarray(hike_segments, dtype=np.int64)], hike_offsets
+    )
+
+    return [
+        (round(d_km, 3), int(ele_gain), seq)
+        for (d_km, seq), ele_gain in zip(hikes, hike_gain.tolist())
+    ]
 
 
 if __name__ == '__main__':
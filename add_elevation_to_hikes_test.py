@@ -0,0 +1,45 @@
+import networkx as nx
+
+import add_elevation_to_hikes
+from add_elevation_to_hikes import segment_edges
+from graph import index_edges, read_hiking_graph
+
+
+def point(node_id, node_type='junction'):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [-74 + node_id / 100, 42]},
+        'properties': {'id': node_id, 'type': node_type},
+    }
+
+
+def trail(a, b, d_km):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'LineString', 'coordinates': [[-74, 42], [-73.9, 42]]},
+        'properties': {'nodes': [a, b], 'd_km': d_km},
+    }
+
+
+def test_segment_edges_reuses_reversed_paths(monkeypatch):
+    # 1 - 2 - 3, plus a longer direct 1 - 3 trail.
+    features = [point(1), point(2), point(3), trail(1, 2, 1), trail(2, 3, 1)]
+    features.append(trail(1, 3, 5))
+    G = read_hiking_graph(features)
+    index_edges(G)
+
+    sources = []
+    dijkstra = nx.single_source_dijkstra_path
+
+    def counting_dijkstra(G, source, **kwargs):
+        sources.append(source)
+        return dijkstra(G, source, **kwargs)
+
+    monkeypatch.setattr(
+        add_elevation_to_hikes.nx, 'single_source_dijkstra_path', counting_dijkstra
+    )
+    forward, backward = segment_edges(G, [(1, 3), (3, 1)])
+    assert sources == [1]
+    assert len(forward) == 2
+    # The same edges, walked the other way: directed IDs differ in the low bit.
+    assert backward == [e ^ 1 for e in forward[::-1]]
@@ -2,25 +2,35 @@
 """Augment OSM trail with a few extra bushwhacks.
 
 This is only relevant for the Catskills -- for the ADKs, we stay on-trail.
+
+Usage: augment_trails.py data/catskills
 """
 
 from glob import glob
 import json
+import os
+import sys
 from typing import List
 
-from osm import OsmElement, OsmNode, closest_point_on_trail
+import json5
+
+from osm import OsmElement, OsmNode, closest_point_on_trail, index_way_nodes
+from spec import Spec
 
-files = glob('data/catskills/additional-trails/*.geojson')
+(data_dir,) = sys.argv[1:]
+files = sorted(glob(f'{data_dir}/additional-trails/*.geojson'))
 print(f'Loading additional trails from {len(files)}: {files}')
 
 
-trails_elements = json.load(open('data/catskills/trails.json'))['elements']
+trails_elements = json.load(open(f'{data_dir}/trails.json'))['elements']
 
 osm_elements: List[OsmElement] = (
-    trails_elements + json.load(open('data/catskills/roads.json'))['elements']
+    trails_elements + json.load(open(f'{data_dir}/roads.json'))['elements']
 )
 osm_ways = [el for el in osm_elements if el['type'] == 'way']
 osm_nodes = {el['id']: el for el in osm_elements if el['type'] == 'node'}
+spec = Spec(json5.load(open(f'{data_dir}/spec.json5')))
+osm_index = index_way_nodes(osm_ways, osm_nodes, projection=spec.projection)
 
 
 ID = 0
@@ -47,12 +57,12 @@ for file in files:
 
     # Force the trail to be connected by adding the closest nodes from other
     # trails/roads on either end.
-    d, start_node = closest_point_on_trail(coords[0][:2], osm_ways, osm_nodes)
+    d, start_node = closest_point_on_trail(coords[0][:2], osm_index)
     if d >= 50:
         print(f'Warning: {coords[0][:2]} is {d} meters from {start_node} for {file}')
         start_node = None
 
-    d, end_node = closest_point_on_trail(coords[-1][:2], osm_ways, osm_nodes)
+    d, end_node = closest_point_on_trail(coords[-1][:2], osm_index)
     if d >= 50:
         print(f'Warning: {coords[-1][:2]} is {d} meters from {end_node} for {file}')
         end_node = None
@@ -89,6 +99,7 @@ for file in files:
     for node in nodes:
         if node['id'] not in osm_nodes:
             osm_nodes[node['id']] = node
+            osm_index.insert(node['lon'], node['lat'], node)
 
     if not start_node:
         detached_nodes.add(nodes[0]['id'])
@@ -104,8 +115,8 @@ for node_id in detached_nodes:
     assert len(node_ways) == 1
     node_way = node_ways[0]
     if (
-        node_way['tags']['source-file']
-        == 'data/catskills/additional-trails/dry-brook-true-summit.geojson'
+        os.path.basename(node_way['tags']['source-file'])
+        == 'dry-brook-true-summit.geojson'
     ):
         # this is just a spur to the true summit; it can be detached.
         continue
@@ -114,9 +125,23 @@ for node_id in detached_nodes:
     is_start_node = node_id == node_way['nodes'][0]
     is_end_node = node_id == node_way['nodes'][-1]
     assert is_start_node or is_end_node
-    other_ways = [way for way in osm_ways if way['id'] != way_id]
+    # Only consider nodes that are on some other way.
+    own_nodes = set(node_way['nodes'])
+    shared_nodes = {
+        n
+        for way in osm_ways
+        if way['id'] != way_id
+        for n in way['nodes']
+        if n in own_nodes
+    }
     coords = (node['lon'], node['lat'])
-    d, closest_node = closest_point_on_trail(coords, other_ways, osm_nodes)
+    d, closest_node = closest_point_on_trail(
+        coords,
+        osm_index,
+        lambda n, own=own_nodes, shared=shared_nodes: (
+            n['id'] not in own or n['id'] in shared
+        ),
+    )
     assert d < 80, f'{coords} is {d} meters from {closest_node}'
 
     if is_end_node:
@@ -125,8 +150,8 @@ for node_id in detached_nodes:
         node_way['nodes'].insert(0, closest_node['id'])
     print(f'Reattached {node_id} to {closest_node["id"]} @ {d} m')
 
-with open('data/catskills/additional-trails.json', 'w') as out:
+with open(f'{data_dir}/additional-trails.json', 'w') as out:
     json.dump({'elements': elements}, out, indent=2)
 
-with open('data/catskills/combined-trails.json', 'w') as out:
+with open(f'{data_dir}/combined-trails.json', 'w') as out:
     json.dump({'elements': trails_elements + elements}, out, indent=2)
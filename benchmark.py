@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""Time the expensive steps on the real Catskills and ADK data.
+
+Usage: benchmark.py [--save-baseline] [--repeat N] [--threshold PCT] [name ...]
+
+Each benchmark reports its best wall-clock time over --repeat runs and its peak
+traced memory (from one extra run under tracemalloc). Results are appended to
+.benchmarks/history.jsonl along with the git commit and the digests of the
+input files. They're compared against .benchmarks/baseline.json, and any
+benchmark that's more than --threshold percent slower (or bigger) than its
+baseline is flagged, provided that its inputs haven't changed. The baseline is
+in absolute seconds, so it's only meaningful on the machine that saved it and
+isn't checked in.
+
+Benchmarks whose data files or dependencies are missing are skipped.
+"""
+
+import argparse
+from dataclasses import dataclass
+import datetime
+import fnmatch
+import importlib.util
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from util import MI_PER_KM, file_digest
+
+BENCH_DIR = Path('.benchmarks')
+HISTORY_FILE = BENCH_DIR / 'history.jsonl'
+BASELINE_FILE = BENCH_DIR / 'baseline.json'
+
+
+@dataclass
+class Benchmark:
+    name: str
+    # Loads the inputs (untimed) and returns the function to time. This runs
+    # before each timed run, so the function may modify its inputs.
+    setup: Callable[[], Callable[[], Any]]
+    inputs: list[str]
+    requires: list[str]
+
+    def missing(self) -> list[str]:
+        return [p for p in self.inputs if not os.path.exists(p)] + [
+            m for m in self.requires if importlib.util.find_spec(m) is None
+        ]
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, inputs: list[str], requires: list[str] = ()):
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, setup, inputs, [*requires]))
+        return setup
+
+    return register
+
+
+def load_json(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_spec(region: str):
+    import json5
+
+    from spec import Spec
+
+    return Spec(json5.load(open(f'data/{region}/spec.json5')))
+
+
+def network_file(region: str) -> str:
+    return f'data/{region}/network-relabeled.geojson'
+
+
+def register_benchmarks():
+    from graph import make_complete_graph, read_hiking_graph
+    from loops import index_peaks, load_and_index, plausible_peak_sequences
+    import loops
+
+    for region in ('catskills', 'adk'):
+        network = network_file(region)
+        spec_file = f'data/{region}/spec.json5'
+
+        @benchmark(f'read_hiking_graph[{region}]', [network])
+        def _(network=network):
+            features = load_json(network)['features']
+            return lambda: read_hiking_graph(features)
+
+        @benchmark(f'load_and_index[{region}]', [network, spec_file])
+        def _(network=network, region=region):
+            features = load_json(network)['features']
+            spec = load_spec(region)
+            return lambda: load_and_index(spec, features)
+
+        @benchmark(f'make_complete_graph[{region}]', [network, spec_file])
+        def _(network=network, region=region):
+            G, peaks_to_lots = load_and_index(
+                load_spec(region), load_json(network)['features']
+            )
+            peaks, lots = max(peaks_to_lots.items(), key=lambda kv: len(kv[0]))
+            return lambda: make_complete_graph(G, [*peaks, *lots])
+
+    # The ADK clusters take minutes each, so only time these for the Catskills.
+    network = network_file('catskills')
+    spec_file = 'data/catskills/spec.json5'
+    for size in (2, 4, 6, 10):
+
+        @benchmark(f'plausible_peak_sequences[{size} peaks]', [network, spec_file])
+        def _(size=size):
+            spec = load_spec('catskills')
+            G, peaks_to_lots = load_and_index(spec, load_json(network)['features'])
+            peaks = sorted(min(peaks_to_lots, key=lambda p: abs(len(p) - size)))
+            peak_idx = index_peaks(G, peaks)
+
+            def run():
+                loops._cache.clear()
+                return plausible_peak_sequences(
+                    G, peaks, peak_idx, max_length=spec.max_peaks_per_hike
+                )
+
+            return run
+
+    hikes_file = 'data/catskills/hikes.json'
+
+    @benchmark('add_ele_to_hikes[catskills]', [network, hikes_file])
+    def _():
+        from add_elevation_to_hikes import add_ele_to_hikes
+
+        geojson = load_json(network)
+        hikes = load_json(hikes_file)
+        return lambda: add_ele_to_hikes(hikes, geojson)
+
+    hikes_ele_file = 'data/catskills/hikes+ele.json'
+    for variant in (
+        'loops-only',
+        'day-hikes-only',
+        'day-loop-hikes-only',
+        'prefer-loop-hikes',
+        'day-prefer-loop-hikes',
+        'unrestricted',
+    ):
+
+        @benchmark(
+            f'subset_cover[{variant}]', [network, hikes_ele_file], ['SetCoverPy']
+        )
+        def _(variant=variant):
+            from all_hikes_subset_cover import cover_variants
+            from subset_cover import find_optimal_hikes_subset_cover
+
+            features = load_json(network)['features']
+            all_hikes = load_json(hikes_ele_file)
+            _desc, hikes = cover_variants(all_hikes, 13 / MI_PER_KM)[variant]
+            return lambda: find_optimal_hikes_subset_cover(features, hikes)
+
+    dem_file = 'data/adk/ele.tif'
+    adk_network = 'data/adk/network+parking.geojson'
+
+    @benchmark('Elevator.meters[adk]', [dem_file, adk_network], ['rasterio'])
+    def _():
+        from elevation import Elevator
+        from formatting import get_coordinates
+
+        ev = Elevator(dem_file)
+        coords = [
+            c
+            for f in load_json(adk_network)['features']
+            if f['geometry']['type'] != 'Point'
+            for c in get_coordinates(f['geometry'])
+        ]
+        return lambda: ev.meters(coords)
+
+    for region in ('catskills', 'adk'):
+        d = f'data/{region}'
+        trails = (
+            f'{d}/combined-trails.json' if region == 'catskills' else f'{d}/trails.json'
+        )
+        parking_inputs = [
+            f'{d}/spec.json5',
+            f'{d}/network.geojson',
+            trails,
+            f'{d}/roads.json',
+            f'{d}/parking.json',
+            f'{d}/extra-lot-names.json',
+        ]
+
+        @benchmark(f'attach_parking[{region}]', parking_inputs)
+        def _(region=region, parking_inputs=parking_inputs):
+            from graph import hikeable_trailheads
+            from parking_lots import attach_parking
+
+            _spec, network, trails, roads, parking, extra_names = parking_inputs
+            spec = load_spec(region)
+            features = load_json(network)['features']
+            # Not load_hikeable_trailheads, which writes a cache into data/.
+            trailheads = hikeable_trailheads(read_hiking_graph(features))
+            trail_els = load_json(trails)['elements']
+            road_els = load_json(roads)['elements']
+            parking_els = load_json(parking)['elements']
+            extra_lot_names = load_json(extra_names)
+            return lambda: attach_parking(
+                spec,
+                features,
+                trail_els,
+                parking_els,
+                road_els,
+                extra_lot_names,
+                trailheads,
+            )
+
+
+def run_benchmark(bench: Benchmark, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        fn = bench.setup()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    fn = bench.setup()
+    tracemalloc.start()
+    fn()
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'secs': min(times),
+        'peak_mb': peak / 1e6,
+        'inputs': {p: file_digest(p) for p in bench.inputs},
+    }
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list[str]:
+    flagged = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or base['inputs'] != result['inputs']:
+            continue
+        for key in ('secs', 'peak_mb'):
+            if result[key] > base[key] * (1 + threshold):
+                flagged.append(
+                    f'{name}: {key} {base[key]:.3f} -> {result[key]:.3f} '
+                    f'(+{100 * (result[key] / base[key] - 1):.0f}%)'
+                )
+    return flagged
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run (glob patterns)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=20,
+        help='flag benchmarks this many percent worse than the baseline',
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='make these results the new baseline',
+    )
+    args = parser.parse_args()
+
+    register_benchmarks()
+    results = {}
+    for bench in BENCHMARKS:
+        if args.names and not any(fnmatch.fnmatch(bench.name, n) for n in args.names):
+            continue
+        if missing := bench.missing():
+            sys.stderr.write(f'{bench.name}: skipped, missing {", ".join(missing)}\n')
+            continue
+        result = run_benchmark(bench, args.repeat)
+        results[bench.name] = result
+        sys.stderr.write(
+            f'{bench.name}: {result["secs"]:.3f}s, {result["peak_mb"]:.1f} MB\n'
+        )
+
+    BENCH_DIR.mkdir(exist_ok=True)
+    with open(HISTORY_FILE, 'a') as out:
+        entry = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'results': results,
+        }
+        out.write(json.dumps(entry) + '\n')
+
+    baseline = load_json(BASELINE_FILE) if BASELINE_FILE.exists() else {}
+    flagged = regressions(results, baseline, args.threshold / 100)
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w') as out:
+            json.dump({**baseline, **results}, out, indent=2)
+    for line in flagged:
+        sys.stderr.write(f'REGRESSION {line}\n')
+    sys.exit(1 if flagged else 0)
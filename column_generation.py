@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+"""Find a minimal set of hikes by column generation, pricing hikes on demand.
+
+Rather than enumerating every plausible hike up front (loops.py) and handing
+them all to a set cover solver (subset_cover.py), this starts from a small pool
+of hikes and alternates between:
+
+- Solving the LP relaxation of the set cover over the pool. Its duals say how
+  much covering each peak is currently worth.
+- Searching each cluster of peaks for hikes whose length is less than the total
+  value of the peaks they cover (negative reduced cost) and adding them.
+
+Once no more such hikes turn up, it solves the integer problem over the pool.
+That's only optimal over the hikes that the pricing search (a beam search)
+found, so it isn't guaranteed to be the best cover overall. Since the full hike
+set is never materialized, this can work with long hikes that loops.py's
+max_peaks_per_hike would rule out.
+
+Usage:
+
+    poetry run python column_generation.py data/catskills/spec.json5 \\
+        data/catskills/network-relabeled.geojson > cover.geojson
+"""
+
+import argparse
+from dataclasses import dataclass
+import json
+import sys
+
+import json5
+import networkx as nx
+
+import metrics
+from add_elevation_to_hikes import add_ele_to_hikes
+from graph import make_complete_graph
+from loops import (
+    cycle_mask,
+    end_lots,
+    has_elevation,
+    load_and_index,
+    path_peak_masks,
+    peak_bits,
+)
+from spec import Spec
+from subset_cover import hikes_feature_collection
+from util import MI_PER_KM, pairkey
+
+# Columns need a reduced cost below -EPS to enter the pool.
+EPS = 1e-6
+# Cost of leaving a peak uncovered. This keeps the LP feasible before the pool
+# has a hike for every peak.
+UNCOVERED_KM = 1000
+
+
+def log(*args):
+    print(*args, file=sys.stderr)
+
+
+@dataclass
+class Cluster:
+    """Shortest paths between the peaks and lots of a cluster, for pricing."""
+
+    peaks: list[int]
+    # Lots that loops can start from.
+    lots: list[int]
+    # Lots that through hikes can start or end at, see loops.end_lots.
+    ends: list[int]
+    # (a, b) -> shortest distance in km, for every pair of peaks and ends.
+    dist: dict[tuple[int, int], float]
+    # (a, b) -> peaks on (or near) the shortest path, see loops.path_peak_masks.
+    masks: dict[tuple[int, int], int]
+    bits: dict[int, int]
+
+    @staticmethod
+    def index(G: nx.Graph, peaks, lots) -> 'Cluster':
+        ends = end_lots(G, lots)
+        gp = make_complete_graph(G, [*peaks, *ends])
+        dist = {}
+        for a, b, d_km in gp.edges(data='weight'):
+            dist[a, b] = dist[b, a] = d_km
+        return Cluster(
+            peaks=list(peaks),
+            lots=list(lots),
+            ends=ends,
+            dist=dist,
+            masks=path_peak_masks(G, gp),
+            bits=peak_bits(G),
+        )
+
+
+@dataclass
+class Column:
+    """A hike in the pool: [lot, peaks..., lot]."""
+
+    cost: float
+    d_km: float
+    nodes: list[int]
+    peaks: list[int]
+
+
+def seed_columns(cluster: Cluster) -> list[Column]:
+    """Out-and-back hikes to each peak from its closest lot, where possible."""
+    columns = []
+    for peak in cluster.peaks:
+        lots = sorted(cluster.lots, key=lambda lot: cluster.dist[lot, peak])
+        for lot in lots:
+            nodes = [lot, peak, lot]
+            if cycle_mask(cluster.masks, nodes) == cluster.bits[peak]:
+                d_km = 2 * cluster.dist[lot, peak]
+                columns.append(Column(d_km, d_km, nodes, [peak]))
+                break
+    return columns
+
+
+def price_hikes(
+    cluster: Cluster,
+    duals: dict[int, float],
+    thru_penalty_km: float | None = 0,
+    max_km: float | None = None,
+    beam_width=50,
+) -> list[tuple[float, Column]]:
+    """Hikes in the cluster with negative reduced cost, most negative first.
+
+    A hike's reduced cost is its cost less the duals of the peaks it covers.
+    This is a beam search: partial hikes (a lot and a sequence of peaks) are
+    extended one peak at a time, keeping the beam_width most promising ones at
+    each step. So it can miss hikes, but any it finds are real. As in loops.py,
+    loops start from the cluster's lots and through hikes can also use lots that
+    are a road walk away (cluster.ends). Through hikes cost thru_penalty_km
+    extra; pass None to only look for loops.
+
+    Returns (reduced cost, column) pairs.
+    """
+    starts = cluster.lots if thru_penalty_km is None else cluster.ends
+    near_lot_km = {
+        peak: min(cluster.dist[peak, lot] for lot in starts) for peak in cluster.peaks
+    }
+    found = {}
+    # (d_km, prize, nodes, visited peaks mask)
+    states = [(0.0, 0.0, (lot,), 0) for lot in starts]
+    for _ in cluster.peaks:
+        extended = {}
+        for d_km, prize, nodes, visited in states:
+            for peak in cluster.peaks:
+                bit = cluster.bits[peak]
+                if visited & bit:
+                    continue
+                d = d_km + cluster.dist[nodes[-1], peak]
+                if max_km is not None and d + near_lot_km[peak] > max_km:
+                    continue
+                key = (nodes[0], visited | bit, peak)
+                if key in extended and extended[key][0] <= d:
+                    continue
+                extended[key] = (
+                    d,
+                    prize + duals.get(peak, 0),
+                    (*nodes, peak),
+                    visited | bit,
+                )
+        # Rank partial hikes by their reduced cost if they went straight back.
+        states = sorted(
+            extended.values(), key=lambda s: s[0] + near_lot_km[s[2][-1]] - s[1]
+        )[:beam_width]
+        if not states:
+            break
+
+        for d_km, prize, nodes, visited in states:
+            ends = [nodes[0]] if thru_penalty_km is None else cluster.ends
+            for end in ends:
+                if end == nodes[0] and end not in cluster.lots:
+                    continue  # Only through hikes use the extra lots.
+                d = d_km + cluster.dist[nodes[-1], end]
+                if max_km is not None and d > max_km:
+                    continue
+                cost = d + (0 if end == nodes[0] else thru_penalty_km)
+                if cost - prize >= -EPS:
+                    continue
+                cycle = [*nodes, end]
+                if cycle_mask(cluster.masks, cycle) != visited:
+                    continue  # It goes over (or near) a peak it doesn't count.
+                # Only keep the best hike for each set of peaks and pair of lots.
+                key = (visited, *pairkey(nodes[0], end))
+                if key not in found or cost - prize < found[key][0]:
+                    found[key] = (cost - prize, Column(cost, d, cycle, [*nodes[1:]]))
+    return sorted(found.values(), key=lambda rc_col: rc_col[0])
+
+
+def _solve_cover(
+    columns: list[Column], peaks: list[int], integer: bool, time_limit_secs=60
+):
+    """Solve the set cover over the columns, as an LP or an integer program.
+
+    Returns (objective, values for each column, duals for each peak). The duals
+    are only meaningful for the LP.
+    """
+    from ortools.linear_solver import pywraplp
+
+    solver = pywraplp.Solver.CreateSolver('SCIP' if integer else 'GLOP')
+    if integer:
+        solver.SetTimeLimit(1000 * time_limit_secs)
+        xs = [solver.BoolVar(f'x{j}') for j in range(len(columns))]
+    else:
+        xs = [solver.NumVar(0, solver.infinity(), f'x{j}') for j in range(len(columns))]
+    objective = solver.Objective()
+    rows = {}
+    for peak in peaks:
+        row = rows[peak] = solver.Constraint(1, solver.infinity())
+        slack = solver.NumVar(0, 1, f'uncovered{peak}')
+        row.SetCoefficient(slack, 1)
+        objective.SetCoefficient(slack, UNCOVERED_KM)
+    for x, column in zip(xs, columns):
+        objective.SetCoefficient(x, column.cost)
+        for peak in column.peaks:
+            if peak in rows:
+                rows[peak].SetCoefficient(x, 1)
+    objective.SetMinimization()
+
+    status = solver.Solve()
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        raise ValueError(f'Set cover solver failed with status {status}')
+    duals = {} if integer else {peak: row.dual_value() for peak, row in rows.items()}
+    return objective.Value(), [x.solution_value() for x in xs], duals
+
+
+def column_generation_cover(
+    G: nx.Graph,
+    peaks_to_lots: dict,
+    peaks: list[int] | None = None,
+    thru_penalty_km: float | None = 0,
+    max_km: float | None = None,
+    beam_width=50,
+    columns_per_cluster=20,
+    max_rounds=100,
+) -> list[Column]:
+    """Find a set of hikes that covers the peaks, as cheaply as possible.
+
+    peaks_to_lots comes from loops.load_and_index. peaks defaults to all of them.
+
+    The integer program at the end only chooses among the columns that the beam
+    search turned up, so this isn't an exact optimum: a hike that price_hikes
+    misses can't be chosen. Likewise, the LP bound that it logs only bounds covers
+    made from those columns.
+    """
+    clusters = [
+        Cluster.index(G, cluster_peaks, lots)
+        for cluster_peaks, lots in peaks_to_lots.items()
+        if lots
+    ]
+    if peaks is None:
+        peaks = [peak for cluster in clusters for peak in cluster.peaks]
+    columns = [c for cluster in clusters for c in seed_columns(cluster)]
+    seen = {tuple(c.nodes) for c in columns}
+
+    for i in range(max_rounds):
+        with metrics.span('column_generation.lp', columns=len(columns)):
+            lp_km, _xs, duals = _solve_cover(columns, peaks, integer=False)
+        new_columns = []
+        with metrics.span('column_generation.pricing'):
+            for cluster in clusters:
+                priced = price_hikes(
+                    cluster, duals, thru_penalty_km, max_km, beam_width
+                )
+                for _rc, column in priced[:columns_per_cluster]:
+                    if tuple(column.nodes) not in seen:
+                        seen.add(tuple(column.nodes))
+                        new_columns.append(column)
+        log(f'Round {i}: LP bound {lp_km:.2f} km, {len(new_columns)} new hikes')
+        metrics.count('column_generation.columns', len(new_columns))
+        if not new_columns:
+            break
+        columns += new_columns
+
+    with metrics.span('column_generation.ip', columns=len(columns)) as span:
+        ip_km, xs, _duals = _solve_cover(columns, peaks, integer=True)
+        span['cost'] = ip_km
+    chosen = [c for c, x in zip(columns, xs) if x > 0.5]
+    covered = {peak for c in chosen for peak in c.peaks}
+    missing = [peak for peak in peaks if peak not in covered]
+    if missing:
+        log(f'No hikes found for {len(missing)} peaks: {missing}')
+    log(f'LP bound: {lp_km:.2f} km, chosen hikes: {ip_km:.2f} km')
+    return chosen
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('spec_file')
+    parser.add_argument('network_file')
+    parser.add_argument('--max-mi', type=float, help='Longest hike to consider.')
+    parser.add_argument(
+        '--loops-only', action='store_true', help='Only consider loop hikes.'
+    )
+    parser.add_argument(
+        '--non-loop-penalty-km',
+        type=float,
+        default=0,
+        help='Extra cost for hikes that start and end at different lots.',
+    )
+    parser.add_argument(
+        '--beam-width',
+        type=int,
+        default=50,
+        help='Partial hikes to keep at each step of the pricing search.',
+    )
+    args = parser.parse_args()
+
+    spec = Spec(json5.load(open(args.spec_file)))
+    features = json.load(open(args.network_file))['features']
+    G, peaks_to_lots = load_and_index(spec, features)
+    chosen = column_generation_cover(
+        G,
+        peaks_to_lots,
+        thru_penalty_km=None if args.loops_only else args.non_loop_penalty_km,
+        max_km=args.max_mi / MI_PER_KM if args.max_mi is not None else None,
+        beam_width=args.beam_width,
+    )
+
+    hikes = [(c.d_km, c.nodes) for c in chosen]
+    if has_elevation(G):
+        hikes_ele = add_ele_to_hikes(hikes, {'features': features})
+    else:
+        hikes_ele = [(d_km, 0, nodes) for d_km, nodes in hikes]
+    hikes_ele = [
+        (c.cost, ele_m, nodes, d_km)
+        for c, (d_km, ele_m, nodes) in zip(chosen, hikes_ele)
+    ]
+    d_km, fc = hikes_feature_collection(features, hikes_ele, G=G)
+    log(f'{len(chosen)} hikes: {d_km:.2f} km = {d_km * MI_PER_KM:.2f} mi')
+    json.dump(fc, sys.stdout)
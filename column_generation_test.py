@@ -0,0 +1,49 @@
+import json
+
+import json5
+from pytest import approx
+
+from column_generation import Cluster, price_hikes
+from loops import load_and_index
+from spec import Spec
+
+spec = Spec(json5.load(open('data/catskills/spec.json5')))
+features = json.load(open('data/catskills/network+parking.geojson'))['features']
+G, peaks_to_lots = load_and_index(spec, features)
+peaks, lots = max(peaks_to_lots.items(), key=lambda kv: len(kv[0]))
+cluster = Cluster.index(G, peaks, lots)
+
+
+def hike_km(nodes):
+    return sum(cluster.dist[a, b] for a, b in zip(nodes[:-1], nodes[1:]))
+
+
+def test_nothing_to_price_without_duals():
+    assert price_hikes(cluster, {}) == []
+
+
+def test_price_loops():
+    duals = {peak: 10 for peak in peaks}
+    priced = price_hikes(cluster, duals, thru_penalty_km=None)
+    assert priced
+    assert [rc for rc, _col in priced] == sorted(rc for rc, _col in priced)
+    for rc, col in priced:
+        assert col.nodes[0] == col.nodes[-1]
+        assert col.nodes[0] in lots
+        assert col.peaks == col.nodes[1:-1]
+        assert col.cost == col.d_km == approx(hike_km(col.nodes))
+        assert rc == approx(col.cost - 10 * len(col.peaks))
+        assert rc < 0
+
+
+def test_price_through_hikes():
+    duals = {peak: 10 for peak in peaks}
+    priced = price_hikes(cluster, duals, thru_penalty_km=5, max_km=20)
+    thrus = [col for _rc, col in priced if col.nodes[0] != col.nodes[-1]]
+    assert thrus
+    for col in thrus:
+        assert col.d_km <= 20
+        assert col.cost == approx(col.d_km + 5)
+        assert {col.nodes[0], col.nodes[-1]} <= {*cluster.ends}
+    # Like loops.py, through hikes can end at lots a road walk away.
+    assert any({col.nodes[0], col.nodes[-1]} - {*lots} for col in thrus)
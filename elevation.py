@@ -1,15 +1,20 @@
 #!/usr/bin/env python
 import json
+import os
 import sys
 
-import rasterio
 import numpy as np
 
 from formatting import get_coordinates
+from util import file_digest
 
 
 class Elevator:
     def __init__(self, dem_file: str):
+        import rasterio
+
+        # Identifies the DEM, so that elevations are only reused with the same one.
+        self.dem_sha256 = file_digest(dem_file)
         self.dem = rasterio.open(dem_file)
         self.bounds = self.dem.bounds
         self.inv = ~self.dem.transform
@@ -51,11 +56,44 @@ def subsample_image(coords, img):
     return weights
 
 
-def add_elevation_to_geojson(geojson, ev):
+ELE_PROPS = ('ele', 'ele_gain', 'ele_loss')
+
+
+def geometry_key(dem_sha256: str | None, geom) -> str:
+    return json.dumps([dem_sha256, geom['coordinates']])
+
+
+def index_elevations(geojson) -> dict[str, dict]:
+    """Map from (DEM, geometry) to elevation properties for a processed file.
+
+    The DEM is the dem_sha256 that add_elevation_to_geojson recorded. Files
+    without one won't match anything.
+    """
+    dem_sha256 = geojson.get('dem_sha256')
+    return {
+        geometry_key(dem_sha256, f['geometry']): {
+            k: f['properties'][k] for k in ELE_PROPS if k in f['properties']
+        }
+        for f in geojson['features']
+    }
+
+
+def add_elevation_to_geojson(geojson, ev, previous: dict[str, dict] | None = None):
+    """Add elevation properties to each feature.
+
+    Features whose geometry is in previous (see index_elevations) reuse its values,
+    provided that previous came from the same DEM.
+    """
+    geojson['dem_sha256'] = ev.dem_sha256
+    num_reused = 0
     for f in geojson['features']:
         geom = f['geometry']
         props = f['properties']
-        if geom['type'] == 'Point':
+        key = geometry_key(ev.dem_sha256, geom)
+        if previous and (ele_props := previous.get(key)):
+            props.update(ele_props)
+            num_reused += 1
+        elif geom['type'] == 'Point':
             ele = ev.meters_one(geom['coordinates'])
             props['ele'] = ele
         else:
@@ -65,12 +103,19 @@ def add_elevation_to_geojson(geojson, ev):
             ele_loss_m = sum(max(0, a - b) for a, b in zip(eles[:-1], eles[1:]))
             props['ele_gain'] = ele_gain_m
             props['ele_loss'] = ele_loss_m
+    if previous is not None:
+        sys.stderr.write(f'Reused elevations for {num_reused} features.\n')
 
 
 if __name__ == '__main__':
-    input_file, dem_file = sys.argv[1:]
+    # The optional third argument is a previous output of this script; if it exists
+    # and used the same DEM, features with unchanged geometry are copied from it.
+    input_file, dem_file, *previous_file = sys.argv[1:]
     ev = Elevator(dem_file)
     data = json.load(open(input_file))
     assert data.get('type') == 'FeatureCollection'
-    add_elevation_to_geojson(data, ev)
+    previous = None
+    if previous_file and os.path.exists(previous_file[0]):
+        previous = index_elevations(json.load(open(previous_file[0])))
+    add_elevation_to_geojson(data, ev, previous)
     json.dump(data, sys.stdout)
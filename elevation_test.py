@@ -0,0 +1,67 @@
+import copy
+
+from elevation import add_elevation_to_geojson, index_elevations
+
+
+class FakeElevator:
+    """Elevation is 10m per degree of latitude; records which points it's asked."""
+
+    def __init__(self, dem_sha256):
+        self.dem_sha256 = dem_sha256
+        self.points = []
+
+    def meters_one(self, lnglat):
+        self.points.append(lnglat)
+        return 10 * lnglat[1]
+
+    def meters(self, lnglats):
+        self.points += lnglats
+        return [10 * lat for _lng, lat in lnglats]
+
+
+def feature(geom_type, coordinates):
+    return {
+        'type': 'Feature',
+        'geometry': {'type': geom_type, 'coordinates': coordinates},
+        'properties': {},
+    }
+
+
+def collection(*features):
+    return {'type': 'FeatureCollection', 'features': [*features]}
+
+
+peak = feature('Point', [0, 5])
+trail = feature('LineString', [[0, 1], [0, 3], [0, 2]])
+
+
+def test_add_elevation():
+    geojson = collection(copy.deepcopy(peak), copy.deepcopy(trail))
+    add_elevation_to_geojson(geojson, FakeElevator('dem1'))
+    assert geojson['dem_sha256'] == 'dem1'
+    assert geojson['features'][0]['properties'] == {'ele': 50}
+    assert geojson['features'][1]['properties'] == {'ele_gain': 20, 'ele_loss': 10}
+
+
+def test_reuse_previous():
+    previous = collection(copy.deepcopy(peak), copy.deepcopy(trail))
+    add_elevation_to_geojson(previous, FakeElevator('dem1'))
+
+    # Only the new feature needs the DEM.
+    new_trail = feature('LineString', [[1, 1], [1, 4]])
+    geojson = collection(copy.deepcopy(peak), copy.deepcopy(trail), new_trail)
+    ev = FakeElevator('dem1')
+    add_elevation_to_geojson(geojson, ev, index_elevations(previous))
+    assert ev.points == [[1, 1], [1, 4]]
+    assert [f['properties'] for f in geojson['features']] == [
+        {'ele': 50},
+        {'ele_gain': 20, 'ele_loss': 10},
+        {'ele_gain': 30, 'ele_loss': 0},
+    ]
+
+    # Nothing is reused from a different DEM.
+    geojson = collection(copy.deepcopy(peak), copy.deepcopy(trail))
+    ev = FakeElevator('dem2')
+    add_elevation_to_geojson(geojson, ev, index_elevations(previous))
+    assert ev.points == [[0, 5], [0, 1], [0, 3], [0, 2]]
+    assert geojson['dem_sha256'] == 'dem2'
@@ -18,7 +18,7 @@ Inputs:
 Output: network.geojson
 """
 
-from collections import Counter, defaultdict
+from collections import defaultdict
 from dataclasses import dataclass
 import json
 import sys
@@ -26,17 +26,19 @@ from typing import Dict, List, Set, Tuple
 
 import json5
 import networkx as nx
+import numpy as np
 
 from osm import (
-    OsmElement,
     OsmNode,
-    dedupe_ways,
     find_path,
+    iter_elements,
     node_link,
     way_link,
 )
+from geo import path_lengths_km
+from osm_arrays import OsmArrays
 from spec import Spec
-from util import haversine, pairkey
+from util import VERBOSE, pairkey
 
 
 @dataclass
@@ -50,70 +52,61 @@ class Trail:
 def extract_network(
     spec: Spec,
     peak_nodes: List[OsmNode],
-    trail_elements: List[OsmElement],
-    road_elements: List[OsmElement],
+    trails: OsmArrays,
+    roads: OsmArrays,
 ):
-    id_to_peak_node = {el['id']: el for el in peak_nodes}
+    """Find the network of notable nodes.
 
-    node_to_trails = defaultdict(list)
-    trail_ways_dupes = [el for el in trail_elements if el['type'] == 'way']
-    trail_ways = [*dedupe_ways(trail_ways_dupes)]
-    trail_nodes = {
-        el['id']: el
-        for el in trail_elements
-        if el['type'] == 'node'
-        # TODO: this filter could probably be applied in the trails.txt query instead.
-        and spec.is_in_bbox(el['lon'], el['lat'])
-    }
-    trail_ways = [
-        way for way in trail_ways if all(node in trail_nodes for node in way['nodes'])
-    ]
-    for el in trail_ways:
-        for node in el['nodes']:
-            node_to_trails[node].append(el['id'])
-    id_to_trail_way = {way['id']: way for way in trail_ways}
+    trails should already be de-duped and filtered to complete ways in the bbox
+    (see read_trails).
+    """
+    id_to_peak_node = {el['id']: el for el in peak_nodes}
+    id_to_trail_way = trails.way_index()
 
-    node_to_roads = defaultdict(list)
-    road_ways = [el for el in road_elements if el['type'] == 'way']
     if spec.roads_that_are_trails:
-        filtered_road_ways = [
-            el
-            for el in road_ways
-            if el['tags'].get('name') not in spec.roads_that_are_trails
-        ]
-        # There are three hits for "Lake Road"
-        assert len(road_ways) - len(filtered_road_ways) >= len(
-            spec.roads_that_are_trails
+        is_road = np.array(
+            [
+                tags.get('name') not in spec.roads_that_are_trails
+                for tags in roads.way_tags
+            ],
+            dtype=bool,
         )
-        road_ways = filtered_road_ways
-    for el in road_ways:
-        for node in el['nodes']:
-            node_to_roads[node].append(el['id'])
+        # There are three hits for "Lake Road"
+        assert (~is_road).sum() >= len(spec.roads_that_are_trails)
+        roads = roads.select_ways(is_road)
 
     # 1. High peaks
-    notable_nodes: Dict[int, OsmElement] = {node['id']: node for node in peak_nodes}
-    trailhead_nodes: Dict[int, OsmElement] = {}
+    notable_nodes: Set[int] = {node['id'] for node in peak_nodes}
     assert len(notable_nodes) == spec.num_peaks
 
     # 2. Junction of 2+ trails
-    for node_id, trails in node_to_trails.items():
-        node = trail_nodes[node_id]
-        if len(trails) >= 2:
-            if node_id not in notable_nodes:
-                notable_nodes[node_id] = node
-
-        if node_id in node_to_roads:
-            trailhead_nodes[node_id] = node
+    trail_node_ids, counts = np.unique(trails.way_nodes, return_counts=True)
+    notable_nodes.update(trail_node_ids[counts >= 2].tolist())
+    trailhead_nodes: Set[int] = set(
+        trail_node_ids[np.isin(trail_node_ids, roads.way_nodes)].tolist()
+    )
 
     # 3. Nodes that appear twice in a way (i.e. a loop / lollipop)
-    for el in trail_ways:
-        node_counts = Counter(el['nodes'])
-        for node_id, count in node_counts.items():
-            if count >= 2:
-                sys.stderr.write(
-                    f'{node_link(node_id)} appears 2+ times in {way_link(el["id"])}\n'
-                )
-                notable_nodes[node_id] = trail_nodes[node_id]
+    owners = trails.way_owners()
+    order = np.lexsort((trails.way_nodes, owners))
+    sorted_nodes = trails.way_nodes[order]
+    sorted_owners = owners[order]
+    is_repeat = (sorted_nodes[1:] == sorted_nodes[:-1]) & (
+        sorted_owners[1:] == sorted_owners[:-1]
+    )
+    repeats = {
+        *zip(
+            sorted_owners[1:][is_repeat].tolist(), sorted_nodes[1:][is_repeat].tolist()
+        )
+    }
+    for way_i, node_id in sorted(repeats):
+        if VERBOSE:
+            way_id = int(trails.way_ids[way_i])
+            sys.stderr.write(
+                f'{node_link(node_id)} appears 2+ times in {way_link(way_id)}\n'
+            )
+        notable_nodes.add(node_id)
+    sys.stderr.write(f'Nodes that appear 2+ times in a way: {len(repeats)}\n')
 
     sys.stderr.write(f'Notable nodes: {len(notable_nodes)}\n')
     sys.stderr.write(f'Trailhead nodes: {len(trailhead_nodes)}\n')
@@ -124,17 +117,14 @@ def extract_network(
     # A path can be relevant because it connects a peak/trail, trail/trail or trail/road
     # but not because it connects two roads.
     # (node, node) -> way[]; nodes are sorted
+    is_key = np.isin(trails.way_nodes, [*notable_nodes, *trailhead_nodes])
+    key_nodes = trails.way_nodes[is_key].tolist()
+    key_offsets = np.concatenate(
+        ([0], np.cumsum(np.bincount(owners[is_key], minlength=trails.num_ways)))
+    ).tolist()
     connections: Dict[Tuple[int, int], List[int]] = defaultdict(list)
-    for way in trail_ways:
-        id = way['id']
-        nodes = [
-            node
-            for node in way['nodes']
-            if node in notable_nodes or node in trailhead_nodes
-        ]
-        if not nodes:
-            continue
-
+    for i, id in enumerate(trails.way_ids.tolist()):
+        nodes = key_nodes[key_offsets[i] : key_offsets[i + 1]]
         for a, b in zip(nodes[:-1], nodes[1:]):
             # At least one node must be notable; they can't both be trailheads.
             if a in notable_nodes or b in notable_nodes:
@@ -172,34 +162,41 @@ def extract_network(
     # - extract the sequence of coordinates
     # - pick the shorter one (where relevant)
     # - record whether it's trail/trail or road/trail
-    paths: list[Trail] = []
+    path_ways: list[tuple[int, list[int]]] = []
     for a, b in peak_g.edges():
         key = pairkey(a, b)
         way_ids = connections[key]
         for way_id in way_ids:
-            # Find the subsequence of nodes and calculate a distance
-            way = id_to_trail_way[way_id]
+            # Find the subsequence of nodes
+            way = trails.way(id_to_trail_way[way_id])
             nodes = find_path(way, a, b)
             assert nodes, f'{way}: [{a}, {b}]'
-            latlons = []
-            for node_id in nodes:
-                n = trail_nodes[node_id]
-                latlons.append((n['lon'], n['lat']))
-            d_km = sum(
-                haversine(alon, alat, blon, blat)
-                for (alon, alat), (blon, blat) in zip(latlons[:-1], latlons[1:])
-            )
-            paths.append(
-                Trail(
-                    d_km=d_km,
-                    way=way_id,
-                    nodes=nodes,
-                    latlons=latlons,
-                )
-            )
+            path_ways.append((way_id, nodes))
+
+    # Calculate the distances for all the paths at once.
+    path_offsets = np.cumsum([0] + [len(nodes) for _way_id, nodes in path_ways])
+    pos = trails.node_positions([n for _way_id, nodes in path_ways for n in nodes])
+    lons, lats = trails.lons[pos], trails.lats[pos]
+    d_kms = path_lengths_km(lons, lats, path_offsets).tolist()
+    lons, lats = lons.tolist(), lats.tolist()
+    paths = [
+        Trail(
+            d_km=d_km,
+            way=way_id,
+            nodes=nodes,
+            latlons=[*zip(lons[start:end], lats[start:end])],
+        )
+        for (way_id, nodes), d_km, start, end in zip(
+            path_ways, d_kms, path_offsets[:-1], path_offsets[1:]
+        )
+    ]
+
+    network_nodes = [*peak_g.nodes()]
+    node_to_trails = trails.ways_through(network_nodes)
+    node_to_roads = roads.ways_through(network_nodes)
 
     features = []
-    for node_id in peak_g.nodes():
+    for node_id in network_nodes:
         peak_node = id_to_peak_node.get(node_id)
         if peak_node:
             features.append(
@@ -220,7 +217,7 @@ def extract_network(
                 }
             )
             continue
-        trail_node = trail_nodes[node_id]
+        trail_node = trails.node(node_id)
         features.append(
             {
                 'type': 'Feature',
@@ -266,7 +263,7 @@ def extract_network(
                 'properties': {
                     'id': path.way,
                     'd_km': path.d_km,
-                    **id_to_trail_way[path.way].get('tags', {}),
+                    **trails.way_tags[id_to_trail_way[path.way]],
                     'nodes': path.nodes,
                     'stroke': '#555555',
                     'stroke-width': 2,
@@ -281,9 +278,14 @@ def extract_network(
 if __name__ == '__main__':
     spec_file, peaks_file, trails_file, roads_file = sys.argv[1:]
     spec = Spec(json5.load(open(spec_file)))
-    peaks, trails, roads = (
-        json.load(open(path))['elements']
-        for path in (peaks_file, trails_file, roads_file)
+    peaks = json.load(open(peaks_file))['elements']
+    trails = OsmArrays.from_elements(
+        iter_elements(trails_file),
+        # TODO: this filter could probably be applied in the trails.txt query instead.
+        keep_node=spec.is_in_bbox,
+        complete_ways_only=True,
     )
+    # Only the road ways' node IDs are needed, not their coordinates.
+    roads = OsmArrays.from_elements(iter_elements(roads_file), with_nodes=False)
     network = extract_network(spec, peaks, trails, roads)
     json.dump(network, sys.stdout)
@@ -1,11 +1,14 @@
-import networkx as nx
-
-from graph import get_lot_index, get_peak_index, read_hiking_graph
 from util import orient
 
 
-def geojson_for_hike(features, d_km, seq):
-    G = read_hiking_graph(features)
+def geojson_for_hike(features, d_km, seq, G=None):
+    """A FeatureCollection for one hike. Pass G to avoid rebuilding the graph."""
+    import networkx as nx
+
+    from graph import get_lot_index, get_peak_index, read_hiking_graph
+
+    if G is None:
+        G = read_hiking_graph(features)
     id_to_peak = get_peak_index(features)
     id_to_lot = get_lot_index(features)
     peak_features = [*id_to_peak.values()]
@@ -43,8 +46,8 @@ def geojson_for_hike(features, d_km, seq):
     return {'type': 'FeatureCollection', 'features': fs}
 
 
-def gpx_for_hike(features, d_km, seq):
-    fs = geojson_for_hike(features, d_km, seq)
+def gpx_for_hike(features, d_km, seq, G=None):
+    fs = geojson_for_hike(features, d_km, seq, G)
     return geojson_to_gpx(fs['features'][-1])
 
 
@@ -0,0 +1,58 @@
+"""Vectorized versions of the distance functions in util."""
+
+import numpy as np
+
+from util import LocalProjection
+
+EARTH_RADIUS_KM = 6371
+
+
+def haversine_km(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Great circle distance in km between arrays of points (in degrees).
+
+    This is util.haversine, but for many pairs of points at once.
+    """
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def segment_lengths_km(lons, lats) -> np.ndarray:
+    """Length of each segment of a polyline; the result has one fewer element."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    return haversine_km(lons[:-1], lats[:-1], lons[1:], lats[1:])
+
+
+def project(projection: LocalProjection, lons, lats) -> np.ndarray:
+    """Project points to an (n, 2) float32 array of meters (see LocalProjection)."""
+    xy = np.empty((len(lons), 2), dtype=np.float32)
+    xy[:, 0] = (
+        np.asarray(lons, dtype=np.float64) - projection.lon0
+    ) * projection.m_per_lng
+    xy[:, 1] = (
+        np.asarray(lats, dtype=np.float64) - projection.lat0
+    ) * projection.m_per_lat
+    return xy
+
+
+def distances_m(xy: np.ndarray, x: float, y: float) -> np.ndarray:
+    """Distance from each projected point to (x, y), in meters."""
+    return np.hypot(xy[:, 0] - x, xy[:, 1] - y)
+
+
+def path_lengths_km(lons, lats, offsets) -> np.ndarray:
+    """Total length of each of many polylines stored back-to-back.
+
+    Polyline i consists of points offsets[i]:offsets[i + 1].
+    """
+    offsets = np.asarray(offsets)
+    seg_km = segment_lengths_km(lons, lats)
+    # Sum the segments within each polyline, skipping the ones that bridge two.
+    totals = np.concatenate(([0.0], np.cumsum(seg_km)))
+    starts = offsets[:-1]
+    ends = np.maximum(offsets[1:] - 1, starts)
+    return totals[ends] - totals[starts]
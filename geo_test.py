@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+from geo import distances_m, path_lengths_km, project
+from util import LocalProjection, haversine
+
+
+def test_path_lengths_km():
+    rng = random.Random(0)
+    paths = [
+        [(rng.uniform(-74.6, -74.0), rng.uniform(41.9, 42.3)) for _ in range(n)]
+        for n in (2, 5, 1, 3)
+    ]
+    lons = [lon for path in paths for lon, _lat in path]
+    lats = [lat for path in paths for _lon, lat in path]
+    offsets = [0, 2, 7, 8, 11]
+    expected = [
+        sum(haversine(*a, *b) for a, b in zip(path[:-1], path[1:])) for path in paths
+    ]
+    actual = path_lengths_km(lons, lats, offsets)
+    assert len(actual) == 4
+    for a, e in zip(actual, expected):
+        assert abs(a - e) < 1e-9
+
+
+def test_projected_distances():
+    # The Adirondacks are far enough north that the Catskills constants are off.
+    projection = LocalProjection.for_bbox(43.978, 44.46, -74.3, -73.613)
+    rng = random.Random(0)
+    points = [
+        (rng.uniform(-74.3, -73.613), rng.uniform(43.978, 44.46)) for _ in range(100)
+    ]
+    lons, lats = zip(*points)
+    xy = project(projection, lons, lats)
+    assert xy.dtype == np.float32
+    for lon, lat in points[:10]:
+        expected = [1000 * haversine(lon, lat, *p) for p in points]
+        actual = distances_m(xy, *projection.xy(lon, lat))
+        for a, e in zip(actual, expected):
+            assert abs(a - e) <= 0.005 * e + 0.01
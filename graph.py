@@ -1,15 +1,58 @@
+import heapq
 import itertools
 
 import networkx as nx
 
+import metrics
+
+
+def dijkstra_to_targets(G, source, targets, weight='weight'):
+    """Shortest distances and paths from source to each of the targets.
+
+    This is nx.single_source_dijkstra, with the same tie-breaking, except that it
+    stops once every target has been reached rather than exploring all of G. So
+    the search only covers the part of G that's closer than the farthest target.
+    Raises KeyError if a target is unreachable.
+    """
+    remaining = {*targets} - {source}
+    dist = {}
+    seen = {source: 0}
+    pred = {source: None}
+    counter = itertools.count()
+    fringe = [(0, next(counter), source)]
+    while fringe and remaining:
+        d, _, v = heapq.heappop(fringe)
+        if v in dist:
+            continue
+        dist[v] = d
+        remaining.discard(v)
+        for u, attrs in G[v].items():
+            vu_dist = d + attrs.get(weight, 1)
+            if u not in dist and (u not in seen or vu_dist < seen[u]):
+                seen[u] = vu_dist
+                heapq.heappush(fringe, (vu_dist, next(counter), u))
+                pred[u] = v
+    if remaining:
+        raise KeyError(f'No path from {source} to {sorted(remaining)}')
+
+    paths = {}
+    for t in targets:
+        path = [t]
+        while (p := pred[path[-1]]) is not None:
+            path.append(p)
+        paths[t] = path[::-1]
+    return {t: dist.get(t, 0) for t in targets}, paths
+
 
 def make_complete_graph(G, nodes, weight='weight'):
     dist = {}
     path = {}
-    for n in nodes:
-        d, p = nx.single_source_dijkstra(G, n, weight=weight)
-        dist[n] = d
-        path[n] = p
+    with metrics.span('make_complete_graph', nodes=len(nodes)):
+        for n in nodes:
+            d, p = dijkstra_to_targets(G, n, nodes, weight=weight)
+            dist[n] = d
+            path[n] = p
+    metrics.count('make_complete_graph.dijkstra', len(nodes))
 
     GG = nx.Graph()
     for u in nodes:
@@ -24,17 +67,121 @@ def make_complete_graph(G, nodes, weight='weight'):
     return GG
 
 
+def index_edges(G: nx.Graph) -> int:
+    """Give each edge of G a sequential 'eid' attribute. Returns the number of edges.
+
+    Each edge has two directed IDs: 2 * eid runs from the first node of the edge's
+    feature to its last node, and 2 * eid + 1 is the reverse.
+    """
+    for i, (_a, _b, attrs) in enumerate(G.edges(data=True)):
+        attrs['eid'] = i
+    return G.number_of_edges()
+
+
+def directed_edge_id(G: nx.Graph, a, b) -> int:
+    """The directed edge ID for walking from a to b (see index_edges)."""
+    attrs = G.edges[a, b]
+    is_forward = attrs['feature']['properties']['nodes'][0] == a
+    return 2 * attrs['eid'] + (0 if is_forward else 1)
+
+
+def nearest_source_labels(G: nx.Graph, sources, weight='weight', cutoff=None):
+    """Run a single multi-source Dijkstra search from all the sources at once.
+
+    Returns a dict mapping each reachable node to (distance, source, predecessor),
+    where source is the closest source to the node and predecessor is the previous
+    node on the shortest path from it (None for the sources themselves).
+    """
+    labels = {}
+    heap = [(0, i, s, s, None) for i, s in enumerate(sources)]
+    heapq.heapify(heap)
+    counter = len(heap)
+    while heap:
+        d, _, node, source, pred = heapq.heappop(heap)
+        if node in labels:
+            continue
+        labels[node] = (d, source, pred)
+        for nbr, attrs in G[node].items():
+            if nbr in labels:
+                continue
+            nd = d + attrs.get(weight, 1)
+            if cutoff is not None and nd > cutoff:
+                continue
+            counter += 1
+            heapq.heappush(heap, (nd, counter, nbr, source, node))
+    return labels
+
+
+def source_path(labels: dict, node) -> list:
+    """Path from the closest source to node, using nearest_source_labels output."""
+    path = [node]
+    while (pred := labels[path[-1]][2]) is not None:
+        path.append(pred)
+    return path[::-1]
+
+
+def hikeable_trailheads(G: nx.Graph) -> list:
+    """Find trailheads from which you can hike to a high peak without walking
+    over another trailhead.
+
+    A trailhead counts if its shortest path to some high peak has no other
+    trailhead on it. There are far fewer peaks than trailheads, so this runs one
+    Dijkstra search out from each peak and follows its shortest-path tree,
+    which is closed off beyond the first trailhead on each branch.
+    """
+    is_trailhead = {n for n in G.nodes() if G.nodes[n]['type'] == 'trailhead'}
+    trailheads = set()
+    for peak in G.nodes():
+        if G.nodes[peak]['type'] != 'high-peak':
+            continue
+        preds, dists = nx.dijkstra_predecessor_and_distance(G, peak)
+        # Nodes whose shortest path from the peak has no trailhead before them.
+        # dists is in the order in which the search settled the nodes, so every
+        # predecessor comes first. With ties, any clean shortest path will do.
+        clean = {peak}
+        for node in dists:
+            if any(p in clean and p not in is_trailhead for p in preds[node]):
+                clean.add(node)
+                if node in is_trailhead:
+                    trailheads.add(node)
+    return [n for n in G.nodes() if n in trailheads]
+
+
 def make_subgraph(G: nx.Graph, nodes):
+    """Contract G down to just the given nodes, preserving connectivity.
+
+    Two of the nodes are connected if they're adjacent in G or if there's a path
+    between them through nodes that aren't kept. Edges between kept nodes keep
+    their data; the others have none, so this doesn't preserve weights/paths.
+
+    Each connected component of removed nodes is found with one depth-first
+    search and becomes a clique over the kept nodes around it.
+    """
     # This is what I thought G.subgraph would do, but I guess I don't understand that!
-    # This makes no attempts to preserve weights/paths, just connectivity
-    nodes_set = set(nodes)
-    to_remove = [n for n in G.nodes() if n not in nodes_set]
-    GG = G.copy()
-    for node in to_remove:
-        # Remove node, adding direct connections between all its neighbors
-        ns = nx.neighbors(GG, node)
-        GG.add_edges_from(itertools.combinations(ns, 2))
-        GG.remove_node(node)
+    keep = set(nodes)
+    GG = nx.Graph()
+    GG.graph.update(G.graph)
+    GG.add_nodes_from((n, d.copy()) for n, d in G.nodes(data=True) if n in keep)
+    GG.add_edges_from(
+        (a, b, d.copy()) for a, b, d in G.edges(data=True) if a in keep and b in keep
+    )
+
+    seen = set()
+    for start in G.nodes():
+        if start in keep or start in seen:
+            continue
+        seen.add(start)
+        stack = [start]
+        boundary = {}  # a dict rather than a set, for a deterministic order
+        while stack:
+            node = stack.pop()
+            for nbr in G[node]:
+                if nbr in keep:
+                    boundary[nbr] = True
+                elif nbr not in seen:
+                    seen.add(nbr)
+                    stack.append(nbr)
+        GG.add_edges_from(itertools.combinations(boundary, 2))
 
     return GG
 
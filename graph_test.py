@@ -0,0 +1,92 @@
+import random
+
+import networkx as nx
+from pytest import approx
+
+from graph import (
+    hikeable_trailheads,
+    make_subgraph,
+    nearest_source_labels,
+    source_path,
+)
+
+
+def test_make_subgraph():
+    # a - x - b    c - y - z - d, e
+    #     |
+    #     f
+    G = nx.Graph()
+    G.add_edge('a', 'x', weight=1)
+    G.add_edge('x', 'b', weight=2)
+    G.add_edge('x', 'f', weight=3)
+    G.add_edge('a', 'b', weight=4)
+    G.add_edge('c', 'y')
+    G.add_edge('y', 'z')
+    G.add_edge('z', 'd')
+    G.add_node('e', type='junction')
+    G.graph['name'] = 'test'
+
+    GG = make_subgraph(G, ['a', 'b', 'c', 'd', 'e', 'f'])
+    assert list(GG.nodes()) == ['a', 'b', 'f', 'c', 'd', 'e']
+    assert {frozenset(e) for e in GG.edges()} == {
+        frozenset(e) for e in [('a', 'b'), ('a', 'f'), ('b', 'f'), ('c', 'd')]
+    }
+    # Existing edges keep their data.
+    assert GG.edges['a', 'b'] == {'weight': 4}
+    assert GG.edges['a', 'f'] == {}
+    assert GG.nodes['e'] == {'type': 'junction'}
+    assert GG.graph == {'name': 'test'}
+
+
+def test_nearest_source_labels_matches_networkx():
+    rng = random.Random(0)
+    for _ in range(50):
+        G = nx.gnm_random_graph(30, 45, seed=rng.randrange(1000))
+        for a, b in G.edges():
+            # Small integer weights, so that there are lots of ties.
+            G.edges[a, b]['weight'] = rng.randint(1, 4)
+        sources = rng.sample(range(30), 3)
+        cutoff = rng.choice([None, 3, 6])
+        labels = nearest_source_labels(G, sources, cutoff=cutoff)
+        expected = nx.multi_source_dijkstra_path_length(G, sources, cutoff=cutoff)
+        # Nodes beyond the cutoff are left out, nodes right at it are kept.
+        assert {n: d for n, (d, _src, _pred) in labels.items()} == expected
+        for node, (d, source, _pred) in labels.items():
+            path = source_path(labels, node)
+            assert path[0] == source and path[-1] == node
+            assert nx.path_weight(G, path, 'weight') == approx(d)
+            # With ties, any of the closest sources will do.
+            assert nx.shortest_path_length(G, source, node, 'weight') == d
+
+
+def test_nearest_source_labels_ties():
+    # s1 - m - s2, with m equally far from both: the first source listed wins.
+    G = nx.Graph()
+    G.add_edge('s1', 'm', weight=1)
+    G.add_edge('m', 's2', weight=1)
+    G.add_edge('s2', 'far', weight=5)
+    labels = nearest_source_labels(G, ['s1', 's2'], cutoff=4)
+    assert labels == {
+        's1': (0, 's1', None),
+        's2': (0, 's2', None),
+        'm': (1, 's1', 's1'),
+    }
+    assert source_path(labels, 'm') == ['s1', 'm']
+
+
+def test_hikeable_trailheads():
+    #  th1 -1- th2 -1- peak
+    #   \______10_____/
+    # th1 can reach the peak without crossing th2, but not on its shortest path.
+    # th3 is on a spur past the peak.
+    G = nx.Graph()
+    G.add_edge('th1', 'th2', weight=1)
+    G.add_edge('th2', 'peak', weight=1)
+    G.add_edge('th1', 'peak', weight=10)
+    G.add_edge('peak', 'j', weight=2)
+    G.add_edge('j', 'th3', weight=1)
+    G.add_node('lonely-th')
+    types = {'peak': 'high-peak', 'j': 'junction'}
+    for n in G.nodes():
+        G.nodes[n]['type'] = types.get(n, 'trailhead')
+    assert hikeable_trailheads(G) == ['th2', 'th3']
@@ -5,11 +5,8 @@ import json
 import random
 import sys
 
-from formatting import geojson_for_hike, gpx_for_hike
-
 from osm import node_link
 
-
 parser = argparse.ArgumentParser(
     prog='Hike Sampler',
     description='Extract hikes for visualization, either as GeoJSON or GPX',
@@ -21,6 +18,9 @@ parser.add_argument('hikes_file', help='Path to hikes+ele.json file')
 
 
 if __name__ == '__main__':
+    # These pull in networkx and numpy, so keep them out of import time.
+    from formatting import geojson_for_hike, gpx_for_hike
+
     args = parser.parse_args()
 
     features = json.load(open(args.network_file))['features']
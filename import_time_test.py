@@ -0,0 +1,34 @@
+"""Guard against heavy dependencies creeping back into module import time."""
+
+import subprocess
+import sys
+
+HEAVY = ['rich', 'numpy', 'networkx', 'SetCoverPy', 'ortools', 'rasterio', 'tqdm']
+
+
+def heavy_modules_loaded_by(module: str) -> list[str]:
+    code = f'import sys, {module}; print(*(m for m in {HEAVY!r} if m in sys.modules))'
+    out = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True
+    )
+    return out.stdout.split()
+
+
+def test_light_modules_stay_light():
+    for module in [
+        'util',
+        'spec',
+        'osm',
+        'osm_diff',
+        'cap_hike_length',
+        'formatting',
+        'hike_sample',
+    ]:
+        assert heavy_modules_loaded_by(module) == [], module
+
+
+def test_solvers_load_lazily():
+    assert 'SetCoverPy' not in heavy_modules_loaded_by('subset_cover')
+    assert 'ortools' not in heavy_modules_loaded_by('tsp')
+    assert 'ortools' not in heavy_modules_loaded_by('column_generation')
+    assert 'rasterio' not in heavy_modules_loaded_by('elevation')
@@ -1,21 +1,35 @@
 #!/usr/bin/env python
 """Find all reasonable loop/out-and-back hikes."""
 
+import argparse
 from collections import defaultdict
-from dataclasses import dataclass
+from dataclasses import dataclass, field, replace
+import hashlib
 import itertools
 import json
 import math
+from multiprocessing import Pool
+from pathlib import Path
 import sys
 
 import json5
 from tqdm import tqdm
 import networkx as nx
 
+import metrics
 from graph import make_complete_graph, make_subgraph, read_hiking_graph
 from osm import node_link
+from spatial import GridIndex
 from spec import Spec
-from util import index_by
+from util import (
+    FT_PER_M,
+    MI_PER_KM,
+    VERBOSE,
+    LocalProjection,
+    code_digest,
+    index_by,
+    pairkey,
+)
 
 
 def log(*args):
@@ -26,7 +40,9 @@ def load_and_index(spec: Spec, raw_features: list):
     # Nix these for now; they really expand the clusters which blows up the problem.
     features = [f for f in raw_features if f['properties'].get('type') != 'lot-to-lot']
 
-    # Add in lot<->lot walks
+    # Add in lot<->lot walks. These never join clusters (lots are removed before
+    # finding peak components) but through hikes can end with one (see end_lots).
+    lot_walks = defaultdict(set)
     for f in raw_features:
         p = f['properties']
         if (
@@ -34,12 +50,18 @@ def load_and_index(spec: Spec, raw_features: list):
             and {p['from'], p['to']} not in spec.bad_lot_walks
         ):
             features.append(f)
+            a, b = p['nodes'][0], p['nodes'][-1]
+            lot_walks[a].add(b)
+            lot_walks[b].add(a)
 
     G = read_hiking_graph(features)
+    G.graph['lot_walks'] = dict(lot_walks)
     peaks = [f for f in features if f['properties'].get('type') == 'high-peak']
     code_to_peak = {f['properties']['code']: f for f in peaks}
 
     G.remove_edges_from(spec.edges_to_toss)
+    if spec.peak_proximity_m:
+        index_peak_proximity(G, spec.peak_proximity_m, spec.projection)
 
     # Find connected components of peaks excluding parking lots.
     # If you can only hike from peak A to peak B via a parking lot, that's two hikes.
@@ -103,17 +125,110 @@ def load_and_index(spec: Spec, raw_features: list):
     return G, peaks_to_lots
 
 
-def through_hikes_for_peak_seq(g, lots, peaks, peak_seqs):
+@dataclass
+class Budget:
+    """Limits on a hike's length and elevation gain. None means no limit.
+
+    Sequences of peaks that can't be hiked within these limits are pruned as
+    they're built, rather than after all the hikes have been found.
+    """
+
+    max_km: float | None = None
+    max_gain_m: float | None = None
+    # Distance from each peak to the cluster's closest lot.
+    lot_km: dict[int, float] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.key = (self.max_km, self.max_gain_m, tuple(sorted(self.lot_km.items())))
+
+    def allows_seq(self, d_km: float, seq, peak_idx) -> bool:
+        """Could a hike that includes this sequence of peaks fit the budget?
+
+        Getting to the sequence from a lot and back is at least as far as the
+        closest lots to its ends, and the gain along any part of a hike is a lower
+        bound for the whole thing.
+        """
+        if not seq:
+            return True
+        if self.max_km is not None:
+            lots_km = self.lot_km.get(seq[0], 0) + self.lot_km.get(seq[-1], 0)
+            if d_km + lots_km > self.max_km:
+                return False
+        if self.max_gain_m is not None:
+            pairs = [*zip(seq[:-1], seq[1:])]
+            gain = sum(peak_idx[a][b].gain_m for a, b in pairs)
+            loss = sum(peak_idx[b][a].gain_m for a, b in pairs)
+            if min(gain, loss) > self.max_gain_m:
+                return False
+        return True
+
+    def fit_hike(self, d_km: float, cycle: list[int], gains) -> list[int] | None:
+        """The hike in whichever direction fits the budget, or None."""
+        if self.max_km is not None and d_km > self.max_km:
+            return None
+        if self.max_gain_m is None:
+            return cycle
+        if cycle_gain(gains, cycle) <= self.max_gain_m:
+            return cycle
+        reverse = cycle[::-1]
+        if cycle_gain(gains, reverse) <= self.max_gain_m:
+            return reverse
+        return None
+
+
+def keep_shortest(hikes: dict, key, d: float, cycle: list[int]):
+    """Record a hike unless there's already a shorter one with the same key.
+
+    Hikes are keyed by (peaks, lot, lot): for the set cover, only the shortest
+    order in which to hike a set of peaks between two lots matters, in either
+    direction.
+    """
+    if key not in hikes or d < hikes[key][0]:
+        hikes[key] = (d, cycle)
+
+
+def end_lots(G, lots) -> list[int]:
+    """The lots that through hikes for a cluster can start or end at.
+
+    These are the cluster's own lots plus any that are a lot<->lot walk away
+    from one of them. The extra lots only add ends to through hikes; they don't
+    make the cluster or its peak sequences any bigger.
+    """
+    lot_walks = G.graph.get('lot_walks', {})
+    extra = {other for lot in lots for other in lot_walks.get(lot, ())} - {*lots}
+    return [*lots, *sorted(extra)]
+
+
+def through_hikes_for_peak_seq(g, lots, peaks, peak_seqs, budget=None, gp=None):
+    """Through hikes for each sequence, ending at two distinct end_lots().
+
+    GP is make_complete_graph(g, peaks + end_lots(g, lots)), if it's already known.
+    """
+    budget = budget or Budget()
     peaks = list(peaks)
-    lots = list(lots)
+    lots = end_lots(g, lots)
     if len(lots) == 1:
         return []  # No through hikes with only one lot
-    hikes = []
-    gp = make_complete_graph(g, peaks + lots)
+    hikes = {}
+    if gp is None:
+        gp = make_complete_graph(g, peaks + lots)
+    bits = peak_bits(g)
+    masks = path_peak_masks(g, gp)
+    gains = path_gains(g, gp) if budget.max_gain_m is not None else None
+    # The best pair of distinct lots for a sequence is always among the two
+    # closest lots to each of its ends.
+    closest = {
+        peak: sorted(lots, key=lambda lot: gp.edges[peak, lot]['weight'])[:2]
+        for peak in peaks
+    }
     for peak_seq_d, peak_seq in peak_seqs:
         best_d = math.inf
         best_cycle = None
-        for lot1, lot2 in itertools.product(lots, lots):
+        # Sequences only come in one orientation, but trying every ordered pair
+        # of lots covers both directions through them.
+        for lot1, lot2 in itertools.product(
+            closest[peak_seq[0]], closest[peak_seq[-1]]
+        ):
             if lot1 == lot2:
                 continue  # we'll handle loops separately
 
@@ -125,27 +240,27 @@ def through_hikes_for_peak_seq(g, lots, peaks, peak_seqs):
             if d < best_d:
                 best_d = d
                 best_cycle = [lot1, *peak_seq, lot2]
-        all_peaks = {
-            node
-            for a, b in zip(best_cycle[:-1], best_cycle[1:])
-            for node in gp.edges[a, b]['path']
-            if g.nodes[node]['type'] == 'high-peak'
-        }
-        if len(all_peaks) == len(peak_seq):
-            # Exclude paths that go over unexpected peaks.
-            # A more stringent check would also exclude paths that go within ~100m of
+        seq_mask = peak_mask(bits, peak_seq)
+        if cycle_mask(masks, best_cycle) == seq_mask:
+            # Exclude paths that go over (or, with spec.peak_proximity_m, near)
             # unexpected peaks.
-            hikes.append((best_d, best_cycle))
+            cycle = budget.fit_hike(best_d, best_cycle, gains)
+            if cycle:
+                key = (seq_mask, *pairkey(cycle[0], cycle[-1]))
+                keep_shortest(hikes, key, best_d, cycle)
 
-    return hikes
+    return [*hikes.values()]
 
 
-def loop_hikes_for_peak_seq(g, lots, peaks, peak_seqs):
+def loop_hikes_for_peak_seq(g, lots, peaks, peak_seqs, budget=None):
+    budget = budget or Budget()
     peaks = list(peaks)
     lots = list(lots)
-    hikes = []
+    hikes = {}
     gp = make_complete_graph(g, peaks + lots)
-    # TODO: pick the best loop for any given subset of peaks, not just sequence.
+    bits = peak_bits(g)
+    masks = path_peak_masks(g, gp)
+    gains = path_gains(g, gp) if budget.max_gain_m is not None else None
     for peak_seq_d, peak_seq in peak_seqs:
         best_d = math.inf
         best_cycle = None
@@ -158,53 +273,137 @@ def loop_hikes_for_peak_seq(g, lots, peaks, peak_seqs):
             if d < best_d:
                 best_d = d
                 best_cycle = [lot, *peak_seq, lot]
-        all_peaks = {
-            node
-            for a, b in zip(best_cycle[:-1], best_cycle[1:])
-            for node in gp.edges[a, b]['path']
-            if g.nodes[node]['type'] == 'high-peak'
-        }
-        if len(all_peaks) == len(peak_seq):
-            # Exclude paths that go over unexpected peaks.
-            # A more stringent check would also exclude paths that go within ~100m of
+        seq_mask = peak_mask(bits, peak_seq)
+        if cycle_mask(masks, best_cycle) == seq_mask:
+            # Exclude paths that go over (or, with spec.peak_proximity_m, near)
             # unexpected peaks.
-            hikes.append((best_d, best_cycle))
+            cycle = budget.fit_hike(best_d, best_cycle, gains)
+            if cycle:
+                key = (seq_mask, *pairkey(cycle[0], cycle[-1]))
+                keep_shortest(hikes, key, best_d, cycle)
 
-    return hikes
+    return [*hikes.values()]
 
 
 _cache = {}
 
 
+def peak_bits(G) -> dict[int, int]:
+    """A distinct bit for each high peak in G, so that sets of peaks can be ints."""
+    bits = G.graph.get('peak_bits')
+    if bits is None:
+        peaks = sorted(n for n, t in G.nodes(data='type') if t == 'high-peak')
+        bits = G.graph['peak_bits'] = {peak: 1 << i for i, peak in enumerate(peaks)}
+    return bits
+
+
+def peak_mask(bits: dict[int, int], nodes) -> int:
+    mask = 0
+    for node in nodes:
+        mask |= bits.get(node, 0)
+    return mask
+
+
+def index_peak_proximity(G, radius_m: float, projection: LocalProjection):
+    """Give each edge a mask of the high peaks within radius_m of its geometry.
+
+    Only the vertices of each edge's geometry are checked, which is plenty for
+    OSM trails. A hike that passes this close to a peak is treated as though it
+    went over it (see path_peak_masks).
+    """
+    bits = peak_bits(G)
+    index = GridIndex(projection)
+    for peak, bit in bits.items():
+        lon, lat = G.nodes[peak]['feature']['geometry']['coordinates'][:2]
+        index.insert(lon, lat, bit)
+    for a, b, f in G.edges(data='feature'):
+        mask = 0
+        for lon, lat, *_ in f['geometry']['coordinates']:
+            for _d, bit in index.within((lon, lat), radius_m):
+                mask |= bit
+        G.edges[a, b]['near_peaks'] = mask
+
+
+def path_peak_masks(G, GP) -> dict[tuple[int, int], int]:
+    """The peaks on (or near) each shortest path in GP as a mask.
+
+    GP comes from make_complete_graph(G, ...). Peaks are near a path if
+    index_peak_proximity has been run on G.
+    """
+    bits = peak_bits(G)
+    masks = {}
+    for a, b, path in GP.edges(data='path'):
+        mask = peak_mask(bits, path)
+        for x, y in zip(path[:-1], path[1:]):
+            mask |= G.edges[x, y].get('near_peaks', 0)
+        masks[a, b] = masks[b, a] = mask
+    return masks
+
+
+def cycle_mask(masks: dict[tuple[int, int], int], nodes) -> int:
+    mask = 0
+    for a, b in zip(nodes[:-1], nodes[1:]):
+        mask |= masks[a, b]
+    return mask
+
+
+def has_elevation(G) -> bool:
+    return all('ele_gain' in f['properties'] for _a, _b, f in G.edges(data='feature'))
+
+
+def path_gains(G, GP) -> dict[tuple[int, int], float]:
+    """Elevation gain (m) along each shortest path in GP, in each direction.
+
+    This needs a network with elevation (see has_elevation).
+    """
+    gains = {}
+    for _a, _b, path in GP.edges(data='path'):
+        gain = loss = 0
+        for x, y in zip(path[:-1], path[1:]):
+            p = G.edges[x, y]['feature']['properties']
+            if p['nodes'][0] == x:
+                gain += p['ele_gain']
+                loss += p['ele_loss']
+            else:
+                gain += p['ele_loss']
+                loss += p['ele_gain']
+        gains[path[0], path[-1]] = gain
+        gains[path[-1], path[0]] = loss
+    return gains
+
+
+def cycle_gain(gains: dict[tuple[int, int], float], nodes) -> float:
+    return sum(gains[a, b] for a, b in zip(nodes[:-1], nodes[1:]))
+
+
 @dataclass
 class PeakPair:
     d_km: float
-    peaks_between: list[int]
+    # The peaks on the shortest path between the pair (including them).
+    peaks_mask: int
+    # Elevation gain going from the first peak to the second, if G has elevation.
+    gain_m: float = 0
 
 
 def index_peaks(G, peaks):
     GP = make_complete_graph(G, peaks)
+    masks = path_peak_masks(G, GP)
+    gains = path_gains(G, GP) if has_elevation(G) else {}
     pairs = {}
     for a, b in itertools.combinations(peaks, 2):
         pairs.setdefault(a, {})
         pairs.setdefault(b, {})
-        peaks_between = [
-            node
-            for node in GP.edges[a, b]['path']
-            if G.nodes[node]['type'] == 'high-peak' and node != a and node != b
-        ]
-        pairs[a][b] = pairs[b][a] = PeakPair(
-            d_km=GP.edges[a, b]['weight'], peaks_between=peaks_between
-        )
+        d_km = GP.edges[a, b]['weight']
+        pairs[a][b] = PeakPair(d_km, masks[a, b], gains.get((a, b), 0))
+        pairs[b][a] = PeakPair(d_km, masks[a, b], gains.get((b, a), 0))
     return pairs
 
 
-def any_surprise_peaks(seq, peak_set, peak_idx):
+def any_surprise_peaks(seq, allowed_mask: int, peak_idx) -> bool:
+    mask = 0
     for a, b in zip(seq[:-1], seq[1:]):
-        for peak in peak_idx[a][b].peaks_between:
-            if peak not in peak_set:
-                return True
-    return False
+        mask |= peak_idx[a][b].peaks_mask
+    return mask & ~allowed_mask != 0
 
 
 def plausible_peak_sequences(
@@ -213,30 +412,48 @@ def plausible_peak_sequences(
     peak_idx,
     max_length=100,
     depth=0,
+    budget=None,
 ) -> list[tuple[float, tuple[int, ...]]]:
+    """Plausible orders in which to hike subsets of peaks, with their lengths.
+
+    Each sequence can be hiked in either direction, so it's only returned in one
+    orientation, with seq[0] < seq[-1]. Sequences that don't fit in the budget
+    are left out.
+
+    With a length limit, these are exactly the sequences you'd get by filtering
+    the unlimited ones with budget.allows_seq. With a gain limit, the sequences
+    that fit are always kept, but the result can also include ones that the
+    unlimited search wouldn't produce: once the shortest order through a set of
+    peaks is pruned for its gain, a longer order that does fit can take its place
+    in the sequences built around it.
+    """
+    budget = budget or Budget()
     # zero peaks / single peaks are always a valid sequence
     if max_length == 0:
         return [(0, tuple())]
     sequences: list[tuple[float, tuple[int, ...]]] = [(0, tuple())] + [
-        (0, (x,)) for x in peaks
+        (0, (x,)) for x in peaks if budget.allows_seq(0, (x,), peak_idx)
     ]
     if len(peaks) <= 1 or max_length <= 1:
         return sequences
 
-    cache_key = (max_length, tuple(sorted(peaks)))
+    cache_key = (max_length, tuple(sorted(peaks)), budget.key)
     result = _cache.get(cache_key)
     if result is not None:
         # log(' ' * depth, f'{peaks} Cache hit (size={len(_cache)})')
+        metrics.count('plausible_peak_sequences.cache_hit')
         return result
+    metrics.count('plausible_peak_sequences.cache_miss')
 
+    bits = peak_bits(g)
     # You can start and end with any pair of peaks.
-    peak_pairs = itertools.combinations(peaks, 2)
+    peak_pairs = itertools.combinations(sorted(peaks), 2)
     if depth == 0:
         peak_pairs = tqdm([*peak_pairs])
     for start_peak, end_peak in peak_pairs:
         other_peaks = [p for p in peaks if p != start_peak and p != end_peak]
         remaining_seqs = plausible_peak_sequences(
-            g, other_peaks, peak_idx, max_length - 2, depth + 1
+            g, other_peaks, peak_idx, max_length - 2, depth + 1, budget
         )
 
         # For each set of "inner" peaks, choose the best sequence and eliminate
@@ -257,23 +474,31 @@ def plausible_peak_sequences(
                 for remaining_d, remaining_seq in inner_seqs:
                     # log('    remaining_d  ', remaining_d)
                     # log('    remaining_seq', remaining_seq)
-                    start_d = by_start[remaining_seq[0]].d_km
-                    end_d = by_end[remaining_seq[-1]].d_km
-                    d = start_d + remaining_d + end_d
+                    # The inner sequence can be hiked in either direction.
+                    first, last = remaining_seq[0], remaining_seq[-1]
+                    d = by_start[first].d_km + remaining_d + by_end[last].d_km
                     if d < best_d:
                         best_d = d
                         best_inner_seq = remaining_seq
+                    if first != last:
+                        d = by_start[last].d_km + remaining_d + by_end[first].d_km
+                        if d < best_d:
+                            best_d = d
+                            best_inner_seq = remaining_seq[::-1]
             # Check for surprise peaks
             best_seq = tuple([start_peak, *best_inner_seq, end_peak])
-            peak_set = {start_peak, end_peak, *inner_peaks}
-            if not any_surprise_peaks(best_seq, peak_set, peak_idx):
-                # Exclude paths that go over unexpected peaks.
-                # A more stringent check would also exclude paths that go within ~100m
-                #  of unexpected peaks.
-                sequences.append((best_d, best_seq))
-
-    # Add in the reverse sequences
-    sequences += [(d, seq[::-1]) for d, seq in sequences if len(seq) >= 2]
+            allowed_mask = (
+                bits[start_peak] | bits[end_peak] | peak_mask(bits, inner_peaks)
+            )
+            if any_surprise_peaks(best_seq, allowed_mask, peak_idx):
+                # Exclude paths that go over (or, with spec.peak_proximity_m, near)
+                # unexpected peaks.
+                continue
+            if not budget.allows_seq(best_d, best_seq, peak_idx):
+                # Any hike containing this sequence would be over budget.
+                metrics.count('plausible_peak_sequences.pruned')
+                continue
+            sequences.append((best_d, best_seq))
 
     _cache[cache_key] = sequences
     if depth <= 1:
@@ -284,16 +509,199 @@ def plausible_peak_sequences(
     return sequences
 
 
+def cluster_graph(G, peaks, lots) -> nx.Graph:
+    """make_complete_graph() over a cluster's peaks and end_lots()."""
+    return make_complete_graph(G, [*peaks, *end_lots(G, lots)])
+
+
+def cluster_key(G, peaks, lots, max_peaks_per_hike, budget=None, gp=None) -> str:
+    """Hash of everything in G that the hikes for a cluster can depend on.
+
+    Every shortest path between two of the cluster's peaks and lots stays within
+    D of them, where D is the longest such path. So the hikes only depend on the
+    part of G within D of the cluster, and on the code in loops.py and the
+    modules it imports. GP is cluster_graph(G, peaks, lots), if it's already known.
+    """
+    budget = budget or Budget()
+    nodes = [*peaks, *end_lots(G, lots)]
+    if gp is None:
+        gp = cluster_graph(G, peaks, lots)
+    d_max = max((d_km for _a, _b, d_km in gp.edges(data='weight')), default=0)
+    nearby = nx.multi_source_dijkstra_path_length(G, nodes, cutoff=d_max)
+    edges = sorted(
+        (*pairkey(a, b), round(d_km, 9))
+        for a, b, d_km in G.subgraph(nearby).edges(data='weight')
+    )
+    nearby_peaks = sorted(n for n in nearby if G.nodes[n]['type'] == 'high-peak')
+    bits = peak_bits(G)
+    near_peaks = sorted(
+        (*pairkey(a, b), [peak for peak, bit in bits.items() if mask & bit])
+        for a, b, mask in G.subgraph(nearby).edges(data='near_peaks')
+        if mask
+    )
+    key = [
+        # This module and the local ones it imports.
+        code_digest(Path(__file__).name),
+        max_peaks_per_hike,
+        list(peaks),
+        list(lots),
+        nearby_peaks,
+        edges,
+    ]
+    if near_peaks:
+        key.append(near_peaks)
+    if budget.max_km is not None or budget.max_gain_m is not None:
+        key.append([budget.max_km, budget.max_gain_m])
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def hikes_for_cluster(G, peaks, lots, max_peaks_per_hike, budget=None, gp=None):
+    """Find all the (loop hikes, through hikes) for a cluster of peaks.
+
+    GP is cluster_graph(G, peaks, lots), if it's already known.
+    """
+    budget = budget or Budget()
+    with metrics.span('hikes_for_cluster', peaks=len(peaks), lots=len(lots)) as span:
+        peak_idx = index_peaks(G, peaks)
+        if budget.max_km is not None:
+            lot_km = nx.multi_source_dijkstra_path_length(G, lots)
+            budget = replace(budget, lot_km={peak: lot_km[peak] for peak in peaks})
+        _cache.clear()
+        # Lot->Lot hikes are not interesting
+        with metrics.span('plausible_peak_sequences', peaks=len(peaks)):
+            plausible_seqs = [
+                p
+                for p in plausible_peak_sequences(
+                    G,
+                    list(peaks),
+                    peak_idx,
+                    max_length=max_peaks_per_hike,
+                    budget=budget,
+                )
+                if p[1]
+            ]
+        log(f'  plausible sequences: {len(plausible_seqs)}')
+        metrics.count('plausible_sequences', len(plausible_seqs))
+        loops = loop_hikes_for_peak_seq(G, lots, peaks, plausible_seqs, budget)
+        thrus = through_hikes_for_peak_seq(
+            G, lots, peaks, plausible_seqs, budget, gp=gp
+        )
+        span.update(sequences=len(plausible_seqs), loops=len(loops), thrus=len(thrus))
+    return loops, thrus
+
+
+_cluster_graph: nx.Graph | None = None
+
+
+def _init_cluster_worker(G: nx.Graph):
+    global _cluster_graph
+    _cluster_graph = G
+
+
+def _hikes_for_cluster(args):
+    peaks, lots, max_peaks_per_hike, budget, gp = args
+    result = hikes_for_cluster(
+        _cluster_graph, peaks, lots, max_peaks_per_hike, budget, gp=gp
+    )
+    # Pool workers don't run atexit handlers.
+    metrics.flush()
+    return peaks, result
+
+
+def compute_clusters(G, clusters, max_peaks_per_hike, budget=None, gps=None):
+    """Run hikes_for_cluster for (peaks, lots) clusters across a process pool.
+
+    GPS optionally maps peaks to their cluster_graph(). Yields
+    (peaks, (loops, thrus)) in the order that the clusters finish.
+    """
+    gps = gps or {}
+    # Start the biggest clusters first so that they don't finish last.
+    tasks = sorted(
+        (
+            (peaks, lots, max_peaks_per_hike, budget, gps.get(peaks))
+            for peaks, lots in clusters
+        ),
+        key=lambda task: -len(task[0]),
+    )
+    with Pool(initializer=_init_cluster_worker, initargs=(G,)) as pool:
+        yield from tqdm(
+            pool.imap_unordered(_hikes_for_cluster, tasks), total=len(tasks)
+        )
+
+
+def cached_hikes_for_clusters(G, peaks_to_lots, max_peaks_per_hike, budget, cache_file):
+    """(loops, thrus) for each cluster, reusing unchanged clusters from cache_file.
+
+    Hikes for each cluster are cached by cluster_key(), so that after a data
+    update only the clusters whose part of the network changed are recomputed.
+    The cache file is rewritten with just the current clusters.
+    """
+    cache_file = Path(cache_file)
+    old_cache = json.load(open(cache_file)) if cache_file.exists() else {}
+    with metrics.span('cluster_keys'):
+        gps = {
+            peaks: cluster_graph(G, peaks, lots)
+            for peaks, lots in peaks_to_lots.items()
+        }
+        keys = {
+            peaks: cluster_key(
+                G, peaks, lots, max_peaks_per_hike, budget, gp=gps[peaks]
+            )
+            for peaks, lots in peaks_to_lots.items()
+        }
+    todo = [
+        (peaks, lots)
+        for peaks, lots in peaks_to_lots.items()
+        if keys[peaks] not in old_cache
+    ]
+    log(f'{len(peaks_to_lots) - len(todo)} clusters are unchanged.')
+    metrics.count('clusters.cached', len(peaks_to_lots) - len(todo))
+    if todo:
+        for peaks, result in compute_clusters(
+            G, todo, max_peaks_per_hike, budget, gps={p: gps[p] for p, _ in todo}
+        ):
+            old_cache[keys[peaks]] = result
+
+    results = {peaks: old_cache[keys[peaks]] for peaks in peaks_to_lots}
+    with open(cache_file, 'w') as out:
+        json.dump({keys[peaks]: result for peaks, result in results.items()}, out)
+    return results
+
+
 if __name__ == '__main__':
-    spec_file, network_file = sys.argv[1:]
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('spec_file')
+    parser.add_argument('network_file')
+    parser.add_argument(
+        '--max-mi', type=float, help='Leave out hikes longer than this many miles.'
+    )
+    parser.add_argument(
+        '--max-gain-ft',
+        type=float,
+        help='Leave out hikes with more elevation gain than this, in feet. '
+        'This needs a network with elevation.',
+    )
+    args = parser.parse_args()
+    spec_file, network_file = args.spec_file, args.network_file
+    budget = Budget(
+        max_km=args.max_mi / MI_PER_KM if args.max_mi is not None else None,
+        max_gain_m=(
+            args.max_gain_ft / FT_PER_M if args.max_gain_ft is not None else None
+        ),
+    )
     spec = Spec(json5.load(open(spec_file)))
     features = json.load(open(network_file))['features']
-    G, peaks_to_lots = load_and_index(spec, features)
+    with metrics.span('load_and_index'):
+        G, peaks_to_lots = load_and_index(spec, features)
+    if budget.max_gain_m is not None and not has_elevation(G):
+        parser.error(f'--max-gain-ft needs elevation data, which {network_file} lacks.')
 
     for peaks, lots in sorted(peaks_to_lots.items(), key=lambda x: len(x[1])):
         log('Lots:', len(lots), lots, 'Peaks:', len(peaks), peaks)
-        for peak in peaks:
-            log('  ', node_link(peak, G.nodes[peak]['feature']['properties']['name']))
+        if VERBOSE:
+            for peak in peaks:
+                name = G.nodes[peak]['feature']['properties']['name']
+                log('  ', node_link(peak, name))
     log(len(peaks_to_lots), 'connected clusters of peaks.')
 
     # 10 peaks / 20 lots
@@ -303,21 +711,17 @@ if __name__ == '__main__':
     num_loops = 0
     num_thrus = 0
 
-    for peaks, lots in tqdm(peaks_to_lots.items()):
+    results = cached_hikes_for_clusters(
+        G,
+        peaks_to_lots,
+        spec.max_peaks_per_hike,
+        budget,
+        Path(network_file).with_suffix('.loops-cache.json'),
+    )
+
+    for peaks, lots in peaks_to_lots.items():
         log(len(peaks), peaks, len(lots), lots)
-        peak_idx = index_peaks(G, peaks)
-        # Lot->Lot hikes are not interesting
-        _cache = {}
-        plausible_seqs = [
-            p
-            for p in plausible_peak_sequences(
-                G, list(peaks), peak_idx, max_length=spec.max_peaks_per_hike
-            )
-            if p[1]
-        ]
-        log(f'  plausible sequences: {len(plausible_seqs)}')
-        loops = loop_hikes_for_peak_seq(G, lots, peaks, plausible_seqs)
-        thrus = through_hikes_for_peak_seq(G, lots, peaks, plausible_seqs)
+        loops, thrus = results[peaks]
         hikes += loops
         hikes += thrus
         log(f'  loops: {len(loops)}, thru: {len(thrus)}')
@@ -0,0 +1,163 @@
+"""Named spans and counters for seeing where time goes in a build.
+
+Tracing is off unless the TRACE environment variable is set:
+
+    TRACE=trace.jsonl poetry run python loops.py ...   # one JSON object per line
+    TRACE=trace.json poetry run python loops.py ...    # Chrome trace format
+
+Chrome traces can be opened in chrome://tracing or https://ui.perfetto.dev.
+Events are appended as they happen, so worker processes can write to the same
+file. Set TRACE_SAMPLE_MS as well to sample the main thread's stack at that
+interval; the samples are written to <TRACE>.folded, which flamegraph.pl and
+speedscope can read.
+"""
+
+from collections import Counter
+import atexit
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+TRACE_FILE = os.environ.get('TRACE')
+SAMPLE_MS = float(os.environ.get('TRACE_SAMPLE_MS') or 0)
+CHROME_FORMAT = bool(TRACE_FILE) and TRACE_FILE.endswith('.json')
+
+counters: Counter[str] = Counter()
+samples: Counter[str] = Counter()
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return TRACE_FILE is not None
+
+
+def _start_chrome_trace():
+    """Write the opening bracket, unless another process already created the file.
+
+    This runs on import, so a process that forks workers has written it before
+    they start. The closing bracket is optional in Chrome's trace format.
+    """
+    try:
+        fd = os.open(TRACE_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return
+    with os.fdopen(fd, 'w') as out:
+        out.write('[\n')
+
+
+def _write(event: dict):
+    line = json.dumps(event) + (',\n' if CHROME_FORMAT else '\n')
+    with _lock, open(TRACE_FILE, 'a') as out:
+        out.write(line)
+
+
+def _span_event(name: str, start_ns: int, end_ns: int, args: dict) -> dict:
+    if CHROME_FORMAT:
+        return {
+            'name': name,
+            'ph': 'X',
+            'ts': start_ns / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+        }
+    return {
+        'type': 'span',
+        'name': name,
+        'start_s': start_ns / 1e9,
+        'dur_s': (end_ns - start_ns) / 1e9,
+        'pid': os.getpid(),
+        'args': args,
+    }
+
+
+@contextmanager
+def span(name: str, **args):
+    """Record how long a block takes. args are stored along with the span."""
+    if not enabled():
+        yield args
+        return
+    start_ns = time.perf_counter_ns()
+    try:
+        yield args  # The block may add more args, e.g. result sizes.
+    finally:
+        _write(_span_event(name, start_ns, time.perf_counter_ns(), args))
+
+
+def count(name: str, n: int = 1):
+    """Add n to a counter. Counters are written out by flush()."""
+    if enabled():
+        counters[name] += n
+
+
+def flush():
+    """Write out and reset the counters and stack samples for this process."""
+    if not enabled():
+        return
+    ts = time.perf_counter_ns()
+    for name, value in sorted(counters.items()):
+        if CHROME_FORMAT:
+            event = {
+                'name': name,
+                'ph': 'C',
+                'ts': ts / 1000,
+                'pid': os.getpid(),
+                'args': {'value': value},
+            }
+        else:
+            event = {
+                'type': 'counter',
+                'name': name,
+                'value': value,
+                'pid': os.getpid(),
+            }
+        _write(event)
+    counters.clear()
+    if samples:
+        with _lock, open(TRACE_FILE + '.folded', 'a') as out:
+            for stack, n in samples.items():
+                out.write(f'{stack} {n}\n')
+        samples.clear()
+
+
+def _sample(_signum, frame):
+    stack = []
+    while frame:
+        code = frame.f_code
+        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    samples[';'.join(reversed(stack))] += 1
+
+
+def _set_sampling_interval(secs: float):
+    import signal
+
+    signal.signal(signal.SIGPROF, _sample)
+    signal.setitimer(signal.ITIMER_PROF, secs, secs)
+
+
+def _reset_in_child():
+    # Counts from before a fork belong to the parent, and timers aren't inherited.
+    counters.clear()
+    samples.clear()
+    if SAMPLE_MS:
+        _set_sampling_interval(SAMPLE_MS / 1000)
+
+
+def _finish():
+    if SAMPLE_MS:
+        # A SIGPROF during interpreter shutdown would kill the process.
+        _set_sampling_interval(0)
+    flush()
+
+
+if enabled():
+    if CHROME_FORMAT:
+        _start_chrome_trace()
+    os.register_at_fork(after_in_child=_reset_in_child)
+    atexit.register(_finish)
+    if SAMPLE_MS:
+        _set_sampling_interval(SAMPLE_MS / 1000)
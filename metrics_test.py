@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+SCRIPT = '''
+import metrics
+with metrics.span('outer', size=2) as span:
+    with metrics.span('inner'):
+        metrics.count('widgets', 3)
+    metrics.count('widgets')
+    span['result'] = 'ok'
+'''
+
+
+def run_traced(trace_file) -> None:
+    env = {**os.environ, 'TRACE': str(trace_file)}
+    subprocess.run([sys.executable, '-c', SCRIPT], env=env, check=True)
+
+
+def test_jsonl_trace(tmp_path):
+    trace_file = tmp_path / 'trace.jsonl'
+    run_traced(trace_file)
+    events = [json.loads(line) for line in trace_file.read_text().splitlines()]
+    assert [(e['type'], e['name']) for e in events] == [
+        ('span', 'inner'),
+        ('span', 'outer'),
+        ('counter', 'widgets'),
+    ]
+    assert events[1]['args'] == {'size': 2, 'result': 'ok'}
+    assert events[1]['dur_s'] >= events[0]['dur_s']
+    assert events[2]['value'] == 4
+
+
+def test_chrome_trace(tmp_path):
+    trace_file = tmp_path / 'trace.json'
+    run_traced(trace_file)
+    run_traced(trace_file)
+    # Chrome allows the closing bracket to be missing; json.loads doesn't.
+    events = json.loads(trace_file.read_text().rstrip(',\n') + ']')
+    assert [(e['ph'], e['name']) for e in events] == [
+        ('X', 'inner'),
+        ('X', 'outer'),
+        ('C', 'widgets'),
+    ] * 2
+
+
+def test_chrome_trace_from_pool(tmp_path):
+    # Worker processes append to the parent's trace; only one opening bracket.
+    trace_file = tmp_path / 'trace.json'
+    script = (
+        'import multiprocessing, metrics\n'
+        'def work(i):\n'
+        '    with metrics.span("work", i=i): pass\n'
+        'if __name__ == "__main__":\n'
+        '    with multiprocessing.Pool(4) as pool: pool.map(work, range(8))\n'
+    )
+    env = {**os.environ, 'TRACE': str(trace_file)}
+    subprocess.run([sys.executable, '-c', script], env=env, check=True)
+    text = trace_file.read_text()
+    assert text.startswith('[\n') and text.count('[') == 1
+    events = json.loads(text.rstrip(',\n') + ']')
+    assert sorted(e['args']['i'] for e in events) == [*range(8)]
+
+
+def test_disabled_by_default():
+    import metrics
+
+    if metrics.enabled():
+        return
+    with metrics.span('noop', x=1) as span:
+        metrics.count('noop')
+    assert span == {'x': 1}
+    assert not metrics.counters
@@ -2,11 +2,13 @@
 
 import networkx as nx
 
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
+import metrics
 
 
 def solve_tsp_with_or_tools(g: nx.Graph, time_limit_secs=30) -> list:
+    from ortools.constraint_solver import routing_enums_pb2
+    from ortools.constraint_solver import pywrapcp
+
     nodes = [*g.nodes()]
     manager = pywrapcp.RoutingIndexManager(len(nodes), 1, 0)
     routing = pywrapcp.RoutingModel(manager)
@@ -33,7 +35,9 @@ def solve_tsp_with_or_tools(g: nx.Graph, time_limit_secs=30) -> list:
     )
     search_parameters.time_limit.seconds = time_limit_secs
     search_parameters.log_search = True
-    solution = routing.SolveWithParameters(search_parameters)
+    with metrics.span('tsp', nodes=len(nodes), time_limit_secs=time_limit_secs):
+        solution = routing.SolveWithParameters(search_parameters)
+    metrics.count('tsp.branches', routing.solver().Branches())
     print('status', routing.status(), not not solution)
 
     solution_weight = 0
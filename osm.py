@@ -1,10 +1,22 @@
+import functools
 import itertools
-from typing import Dict, Iterable, List, Literal, Tuple, TypedDict, Union
-from util import catskills_haversine
-
-from rich.console import Console
-
-from util import haversine
+import json
+import re
+import sys
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Tuple,
+    TypedDict,
+    Union,
+)
+
+from spatial import GridIndex
+from util import LocalProjection, haversine
 
 
 class OsmElementBase(TypedDict):
@@ -79,25 +91,36 @@ def find_path(way: OsmWay, a: int, b: int) -> List[int]:
     return nodes[i : j - 1 : -1]
 
 
+def index_way_nodes(
+    ways: Iterable[OsmWay],
+    nodes: Dict[int, OsmNode],
+    projection: LocalProjection,
+    index: GridIndex[OsmNode] | None = None,
+) -> GridIndex[OsmNode]:
+    """Add the nodes of these ways to a spatial index (or a new one).
+
+    A new index uses the given projection, typically Spec.projection.
+    """
+    if index is None:
+        index = GridIndex(projection)
+    seen = set()
+    for way in ways:
+        for node_id in way['nodes']:
+            if node_id in seen:
+                continue
+            seen.add(node_id)
+            node = nodes[node_id]
+            index.insert(node['lon'], node['lat'], node)
+    return index
+
+
 def closest_point_on_trail(
     lon_lat: Tuple[float, float],
-    trail_ways: List[OsmWay],
-    trail_nodes: Dict[int, OsmNode],
+    trail_index: GridIndex[OsmNode],
+    predicate: Callable[[OsmNode], bool] | None = None,
 ):
-    best_node = None
-    best_d = 1000
-    lon1, lat1 = lon_lat
-
-    for way in trail_ways:
-        for node_id in way['nodes']:
-            node = trail_nodes[node_id]
-            lon2 = node['lon']
-            lat2 = node['lat']
-            d = catskills_haversine(lon1, lat1, lon2, lat2)
-            if d < best_d:
-                best_d = d
-                best_node = node
-    return best_d * 1000, best_node
+    """Find the closest indexed node to a point. Returns (meters, node)."""
+    return trail_index.nearest(lon_lat, predicate)
 
 
 def distance(
@@ -134,26 +157,27 @@ def element_centroid(el: OsmElement, nodes: Dict[int, OsmNode]) -> tuple[float,
 
 
 def way_length(nodes: list[int], id_to_node: Dict[int, OsmNode]) -> float:
-    node_els = [id_to_node[n] for n in nodes]
-    return sum(
-        haversine(a['lon'], a['lat'], b['lon'], b['lat'])
-        for a, b in zip(node_els[:-1], node_els[1:])
-    )
+    from geo import segment_lengths_km
 
-
-CATSKILLS_BBOX = (41.813, -74.855, 42.352, -73.862)
+    node_els = [id_to_node[n] for n in nodes]
+    lons = [node['lon'] for node in node_els]
+    lats = [node['lat'] for node in node_els]
+    return float(segment_lengths_km(lons, lats).sum())
 
 
-def is_in_catskills(lon: float, lat: float) -> bool:
-    lat1, lon1, lat2, lon2 = CATSKILLS_BBOX
-    return lat1 <= lat <= lat2 and lon1 <= lon <= lon2
+@functools.cache
+def _stderr_is_tty() -> bool:
+    return sys.stderr.isatty()
 
 
 def link(url: str, text: str):
-    console = Console()
-    with console.capture() as capture:
-        console.print(f'[link={url}]{text}[/link]', end='')
-    return capture.get()
+    """Format a terminal hyperlink (OSC 8) for logging to stderr.
+
+    If stderr isn't a terminal, this is just the text.
+    """
+    if not _stderr_is_tty():
+        return text
+    return f'\x1b]8;;{url}\x1b\\{text}\x1b]8;;\x1b\\'
 
 
 def node_link(node: int, name: str | None = None):
@@ -178,38 +202,42 @@ def element_link(el: OsmElement):
     raise NotImplementedError('Links to relations are not implemented.')
 
 
-PEAKS = [
-    ('S', 2426171552, 'Slide Mountain'),
-    ('H', 1938201532, 'Hunter Mountain'),
-    ('BD', 2473476912, 'Blackdome Mountain'),
-    ('BH', 2473476747, 'Blackhead Mountain'),
-    ('TC', 2473476927, 'Thomas Cole Mountain'),
-    ('We', 2955311547, 'West Kill Mountain'),
-    ('C', 2884119551, 'Cornell Mountain'),
-    ('Ta', 7292479776, 'Table Mountain'),
-    ('Pk', 2398015279, 'Peekamoose Mountain'),
-    ('Pl', 2882649917, 'Plateau Mountain'),
-    ('Su', 2882649730, 'Sugarloaf Mountain'),
-    ('W', 2884119672, 'Wittenberg Mountain'),
-    ('SW', 1938215682, 'Southwest Hunter'),
-    ('L', -6601, 'Lone Mountain'),
-    ('BL', 2897919022, 'Balsam Lake Mountain'),
-    ('P', 9147145385, 'Panther Mountain'),
-    ('BI', 357548762, 'Big Indian Mtn Mountain'),
-    ('Fr', 9953707705, 'Friday Mountain'),
-    ('Ru', 10033501291, 'Rusk Mountain'),
-    ('KHP', 9785950126, 'Kaaterskill High Peak'),
-    ('Tw', 7982977638, 'Twin Mountain'),
-    ('BC', 9953729846, 'Balsam Cap Mountain'),
-    ('Fi', 357559622, 'Fir Mountain'),
-    ('ND', 357574030, 'North Dome Mountain'),
-    ('B', 2845338212, 'Balsam Mountain'),
-    ('Bp', 212348771, 'Bearpen Mountain'),
-    ('E', 357557378, 'Eagle Mountain'),
-    ('IH', 7978185605, 'Indian Head Mountain'),
-    ('Sh', 10010091368, 'Sherrill Mountain'),
-    ('V', -5149, 'Vly Mountain'),
-    ('WHP', 2426236522, 'Windham High Peak'),
-    ('Ha', 357563196, 'Halcott Mountain'),
-    ('Ro', -6003, 'Rocky Mountain'),
-]
+ELEMENTS_RE = re.compile(r'"elements"\s*:\s*\[')
+
+
+def iter_elements(path: str, chunk_size: int = 1 << 20) -> Iterator[OsmElement]:
+    """Incrementally parse the "elements" array of an Overpass JSON file."""
+    decoder = json.JSONDecoder()
+    with open(path) as f:
+        buf = f.read(chunk_size)
+        while not (m := ELEMENTS_RE.search(buf)):
+            more = f.read(chunk_size)
+            if not more:
+                raise ValueError(f'No "elements" array in {path}')
+            buf += more
+        pos = m.end()
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buf):
+                if eof:
+                    raise ValueError(f'Unterminated "elements" array in {path}')
+                buf = f.read(chunk_size)
+                pos = 0
+                eof = not buf
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                el, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # Most likely the element straddles a chunk boundary.
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+            yield el
@@ -0,0 +1,180 @@
+"""Compact, array-backed storage for Overpass results.
+
+Overpass results for a whole region are large, and json.load-ing them produces
+a dict per node. osm.iter_elements() parses a results file one element at a time,
+and OsmArrays packs the nodes and ways into flat numpy arrays as they stream by.
+"""
+
+from array import array
+from typing import Callable, Iterable
+
+import numpy as np
+
+from osm import OsmElement, OsmNode, OsmWay
+
+
+class OsmArrays:
+    """Nodes and ways from an Overpass result, stored as flat arrays.
+
+    Nodes are sorted by ID. Ways are sorted by ID and their node IDs are stored
+    back-to-back in way_nodes, with way i's nodes at
+    way_nodes[way_offsets[i]:way_offsets[i + 1]].
+    """
+
+    def __init__(
+        self,
+        node_ids: np.ndarray,
+        lons: np.ndarray,
+        lats: np.ndarray,
+        node_tags: dict[int, dict],
+        way_ids: np.ndarray,
+        way_offsets: np.ndarray,
+        way_nodes: np.ndarray,
+        way_tags: list[dict],
+    ):
+        self.node_ids = node_ids
+        self.lons = lons
+        self.lats = lats
+        self.node_tags = node_tags
+        self.way_ids = way_ids
+        self.way_offsets = way_offsets
+        self.way_nodes = way_nodes
+        self.way_tags = way_tags
+
+    @staticmethod
+    def from_elements(
+        elements: Iterable[OsmElement],
+        keep_node: Callable[[float, float], bool] | None = None,
+        with_nodes: bool = True,
+        complete_ways_only: bool = False,
+    ) -> 'OsmArrays':
+        """Pack elements into arrays in a single pass.
+
+        keep_node(lon, lat) filters nodes as they are read; with_nodes=False drops
+        them all (e.g. when only the ways' node IDs are needed). With
+        complete_ways_only, ways that reference a dropped node are dropped, too.
+        Duplicate ways are collapsed, preferring the version with more tags.
+        Relations are ignored.
+        """
+        node_ids, lons, lats = array('q'), array('d'), array('d')
+        node_tags = {}
+        way_ids, way_lens, way_nodes = array('q'), array('q'), array('q')
+        way_tags = []
+        for el in elements:
+            t = el['type']
+            if t == 'node':
+                if not with_nodes or (
+                    keep_node and not keep_node(el['lon'], el['lat'])
+                ):
+                    continue
+                node_ids.append(el['id'])
+                lons.append(el['lon'])
+                lats.append(el['lat'])
+                if el.get('tags'):
+                    node_tags[el['id']] = el['tags']
+            elif t == 'way':
+                way_ids.append(el['id'])
+                way_lens.append(len(el['nodes']))
+                way_nodes.extend(el['nodes'])
+                way_tags.append(el.get('tags', {}))
+
+        node_ids = np.frombuffer(node_ids, dtype=np.int64)
+        node_ids, first = np.unique(node_ids, return_index=True)
+        lons = np.frombuffer(lons, dtype=np.float64)[first]
+        lats = np.frombuffer(lats, dtype=np.float64)[first]
+
+        way_ids = np.frombuffer(way_ids, dtype=np.int64)
+        way_lens = np.frombuffer(way_lens, dtype=np.int64)
+        way_nodes = np.frombuffer(way_nodes, dtype=np.int64)
+        way_starts = np.cumsum(way_lens) - way_lens
+        num_tags = np.fromiter((len(tags) for tags in way_tags), dtype=np.int64)
+        order = np.lexsort((-num_tags, way_ids))
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = way_ids[order][1:] != way_ids[order][:-1]
+        keep = order[is_first]
+        if complete_ways_only:
+            owner = np.repeat(np.arange(len(way_ids)), way_lens)
+            incomplete = np.zeros(len(way_ids), dtype=bool)
+            incomplete[owner[~np.isin(way_nodes, node_ids)]] = True
+            keep = keep[~incomplete[keep]]
+
+        lens = way_lens[keep]
+        offsets = np.concatenate(([0], np.cumsum(lens)))
+        flat_index = np.repeat(way_starts[keep] - offsets[:-1], lens) + np.arange(
+            offsets[-1]
+        )
+        return OsmArrays(
+            node_ids=node_ids,
+            lons=lons,
+            lats=lats,
+            node_tags=node_tags,
+            way_ids=way_ids[keep],
+            way_offsets=offsets,
+            way_nodes=way_nodes[flat_index],
+            way_tags=[way_tags[i] for i in keep],
+        )
+
+    @property
+    def num_ways(self) -> int:
+        return len(self.way_ids)
+
+    def way_owners(self) -> np.ndarray:
+        """The index of the way that each entry of way_nodes belongs to."""
+        return np.repeat(np.arange(self.num_ways), np.diff(self.way_offsets))
+
+    def select_ways(self, keep: np.ndarray) -> 'OsmArrays':
+        """A copy with only the ways where keep is True (nodes are shared)."""
+        lens = np.diff(self.way_offsets)[keep]
+        return OsmArrays(
+            node_ids=self.node_ids,
+            lons=self.lons,
+            lats=self.lats,
+            node_tags=self.node_tags,
+            way_ids=self.way_ids[keep],
+            way_offsets=np.concatenate(([0], np.cumsum(lens))),
+            way_nodes=self.way_nodes[keep[self.way_owners()]],
+            way_tags=[tags for tags, k in zip(self.way_tags, keep) if k],
+        )
+
+    def ways_through(self, node_ids: np.ndarray) -> dict[int, list[int]]:
+        """Map each of these node IDs to the IDs of the ways that include it.
+
+        A way is listed once for each time the node appears in it.
+        """
+        mask = np.isin(self.way_nodes, node_ids)
+        out: dict[int, list[int]] = {}
+        way_ids = self.way_ids[self.way_owners()[mask]]
+        for node_id, way_id in zip(self.way_nodes[mask].tolist(), way_ids.tolist()):
+            out.setdefault(node_id, []).append(way_id)
+        return out
+
+    def node_positions(self, ids) -> np.ndarray:
+        """Indices into node_ids / lons / lats for these (known) node IDs."""
+        return np.searchsorted(self.node_ids, ids)
+
+    def nodes_of(self, i: int) -> np.ndarray:
+        return self.way_nodes[self.way_offsets[i] : self.way_offsets[i + 1]]
+
+    def way_index(self) -> dict[int, int]:
+        """Map from way ID to its position in way_ids."""
+        return {way_id: i for i, way_id in enumerate(self.way_ids.tolist())}
+
+    def node(self, node_id: int) -> OsmNode:
+        i = self.node_positions(node_id)
+        node = {
+            'type': 'node',
+            'id': node_id,
+            'lat': float(self.lats[i]),
+            'lon': float(self.lons[i]),
+        }
+        if node_id in self.node_tags:
+            node['tags'] = self.node_tags[node_id]
+        return node
+
+    def way(self, i: int) -> OsmWay:
+        return {
+            'type': 'way',
+            'id': int(self.way_ids[i]),
+            'nodes': self.nodes_of(i).tolist(),
+            'tags': self.way_tags[i],
+        }
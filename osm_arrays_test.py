@@ -0,0 +1,80 @@
+import numpy as np
+
+from osm_arrays import OsmArrays
+
+
+def node(node_id, lon, lat, **tags):
+    el = {'type': 'node', 'id': node_id, 'lon': lon, 'lat': lat}
+    if tags:
+        el['tags'] = tags
+    return el
+
+
+def way(way_id, nodes, **tags):
+    return {'type': 'way', 'id': way_id, 'nodes': nodes, 'tags': tags}
+
+
+ELEMENTS = [
+    node(3, -74.3, 42.3),
+    node(1, -74.1, 42.1, natural='peak'),
+    node(2, -74.2, 42.2),
+    node(9, -80.0, 42.0),  # Outside the bbox below.
+    way(20, [1, 2, 3], highway='path', name='Long Trail'),
+    way(10, [3, 2]),
+    # Overpass repeats ways that match more than one statement in a query.
+    way(20, [1, 2, 3], highway='path'),
+    way(30, [2, 9]),
+    {'type': 'relation', 'id': 1, 'members': []},
+]
+
+
+def in_bbox(lon, lat):
+    return -75 < lon < -74
+
+
+def test_from_elements():
+    arrays = OsmArrays.from_elements(ELEMENTS, keep_node=in_bbox)
+    assert arrays.node_ids.tolist() == [1, 2, 3]
+    assert arrays.lons.tolist() == [-74.1, -74.2, -74.3]
+    assert arrays.node(1) == {
+        'type': 'node',
+        'id': 1,
+        'lat': 42.1,
+        'lon': -74.1,
+        'tags': {'natural': 'peak'},
+    }
+
+    # Ways are sorted by ID, and the duplicate with more tags wins.
+    assert arrays.way_ids.tolist() == [10, 20, 30]
+    assert [arrays.way(i) for i in range(arrays.num_ways)] == [
+        way(10, [3, 2]),
+        way(20, [1, 2, 3], highway='path', name='Long Trail'),
+        way(30, [2, 9]),
+    ]
+    assert arrays.way_index() == {10: 0, 20: 1, 30: 2}
+    assert arrays.node_positions([3, 1]).tolist() == [2, 0]
+
+
+def test_complete_ways_only():
+    # Way 30 goes to a node outside the bbox.
+    arrays = OsmArrays.from_elements(
+        ELEMENTS, keep_node=in_bbox, complete_ways_only=True
+    )
+    assert arrays.way_ids.tolist() == [10, 20]
+    assert arrays.way_offsets.tolist() == [0, 2, 5]
+    assert arrays.way_nodes.tolist() == [3, 2, 1, 2, 3]
+
+    arrays = OsmArrays.from_elements(ELEMENTS, with_nodes=False)
+    assert len(arrays.node_ids) == 0
+    assert arrays.way_ids.tolist() == [10, 20, 30]
+
+
+def test_select_ways_and_ways_through():
+    arrays = OsmArrays.from_elements(ELEMENTS)
+    assert arrays.ways_through(np.array([2, 9])) == {2: [10, 20, 30], 9: [30]}
+
+    selected = arrays.select_ways(np.array([False, True, True]))
+    assert [selected.way(i)['id'] for i in range(selected.num_ways)] == [20, 30]
+    assert selected.way_offsets.tolist() == [0, 3, 5]
+    assert selected.way_nodes.tolist() == [1, 2, 3, 2, 9]
+    assert selected.ways_through(np.array([3])) == {3: [20]}
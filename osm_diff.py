@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Compare two Overpass results by element ID and version.
+
+Usage: osm_diff.py old.json new.json
+
+Overpass only includes versions with "out meta"; for other results, elements
+are compared by their content.
+
+run_overpass_query.py uses replace_if_changed to only overwrite a result under
+data/ when its elements changed. pipeline.py reruns a stage when the contents
+of its inputs change, so leaving an unchanged result alone (rather than writing
+a fresh copy with a new timestamp) keeps every stage that reads it cached.
+"""
+
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+import shutil
+import sys
+from typing import Iterable
+
+from osm import OsmElement, iter_elements
+
+ElementKey = tuple[str, int]
+
+
+def element_version(el: OsmElement) -> int | str:
+    if 'version' in el:
+        return el['version']
+    return hashlib.sha1(json.dumps(el, sort_keys=True).encode()).hexdigest()
+
+
+def index_versions(elements: Iterable[OsmElement]) -> dict[ElementKey, int | str]:
+    return {(el['type'], el['id']): element_version(el) for el in elements}
+
+
+@dataclass
+class OsmDiff:
+    added: set[ElementKey] = field(default_factory=set)
+    removed: set[ElementKey] = field(default_factory=set)
+    changed: set[ElementKey] = field(default_factory=set)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self) -> str:
+        parts = []
+        for el_type in ('node', 'way', 'relation'):
+            counts = [
+                sum(1 for t, _ in keys if t == el_type)
+                for keys in (self.added, self.removed, self.changed)
+            ]
+            if any(counts):
+                parts.append('{}: +{} -{} ~{}'.format(el_type, *counts))
+        return ', '.join(parts) or 'no changes'
+
+
+def diff_versions(
+    old: dict[ElementKey, int | str], new: dict[ElementKey, int | str]
+) -> OsmDiff:
+    return OsmDiff(
+        added=new.keys() - old.keys(),
+        removed=old.keys() - new.keys(),
+        changed={k for k in old.keys() & new.keys() if old[k] != new[k]},
+    )
+
+
+def diff_files(old_file: str, new_file: str) -> OsmDiff:
+    return diff_versions(
+        index_versions(iter_elements(old_file)), index_versions(iter_elements(new_file))
+    )
+
+
+def replace_if_changed(path: str, new_file: str) -> OsmDiff | None:
+    """Copy new_file to path, unless path already has the same elements.
+
+    Returns the diff, or None if path didn't exist yet.
+    """
+    diff = diff_files(path, new_file) if os.path.exists(path) else None
+    if diff is None or diff:
+        tmp_path = f'{path}.tmp'
+        shutil.copyfile(new_file, tmp_path)
+        os.replace(tmp_path, path)
+    return diff
+
+
+if __name__ == '__main__':
+    old_file, new_file = sys.argv[1:]
+    diff = diff_files(old_file, new_file)
+    print(diff.summary())
+    for key in sorted(diff.added | diff.removed | diff.changed):
+        status = '+' if key in diff.added else '-' if key in diff.removed else '~'
+        print(f'{status} {key[0]}/{key[1]}')
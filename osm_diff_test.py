@@ -0,0 +1,53 @@
+import json
+
+from osm_diff import diff_versions, index_versions, replace_if_changed
+
+
+def test_diff_versions():
+    old = [
+        {'type': 'node', 'id': 1, 'lat': 42.0, 'lon': -74.0},
+        {'type': 'node', 'id': 2, 'lat': 42.1, 'lon': -74.1},
+        {'type': 'way', 'id': 1, 'nodes': [1, 2]},
+    ]
+    new = [
+        {'type': 'node', 'id': 1, 'lat': 42.0, 'lon': -74.0},
+        {'type': 'node', 'id': 2, 'lat': 42.2, 'lon': -74.1},
+        {'type': 'node', 'id': 3, 'lat': 42.3, 'lon': -74.1},
+        {'type': 'way', 'id': 1, 'nodes': [1, 2, 3]},
+    ]
+    diff = diff_versions(index_versions(old), index_versions(new))
+    assert diff.added == {('node', 3)}
+    assert diff.removed == set()
+    assert diff.changed == {('node', 2), ('way', 1)}
+    assert diff.summary() == 'node: +1 -0 ~1, way: +0 -0 ~1'
+
+    # With "out meta", versions are compared rather than contents.
+    old = [{'type': 'way', 'id': 1, 'version': 3, 'nodes': [1, 2]}]
+    new = [{'type': 'way', 'id': 1, 'version': 3, 'nodes': [1, 2], 'tags': {}}]
+    assert not diff_versions(index_versions(old), index_versions(new))
+
+
+def test_replace_if_changed(tmp_path):
+    def write(name, timestamp, elements):
+        path = tmp_path / name
+        path.write_text(
+            json.dumps(
+                {'osm3s': {'timestamp_osm_base': timestamp}, 'elements': elements}
+            )
+        )
+        return str(path)
+
+    node = {'type': 'node', 'id': 1, 'lat': 42.0, 'lon': -74.0}
+    out = str(tmp_path / 'out.json')
+    assert replace_if_changed(out, write('a.json', 't1', [node])) is None
+    before = open(out).read()
+
+    # A fresh result with the same elements leaves the file alone.
+    diff = replace_if_changed(out, write('b.json', 't2', [node]))
+    assert not diff
+    assert open(out).read() == before
+
+    moved = {**node, 'lat': 42.1}
+    diff = replace_if_changed(out, write('c.json', 't3', [moved]))
+    assert diff.changed == {('node', 1)}
+    assert json.load(open(out))['elements'] == [moved]
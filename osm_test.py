@@ -1,4 +1,9 @@
-from osm import find_path
+import json
+
+import pytest
+
+import osm
+from osm import find_path, iter_elements, node_link
 
 
 def test_find_path():
@@ -61,3 +66,62 @@ def test_find_path():
     }
     path = find_path(way_with_dupe_nodes, 2908399438, 2908399438)
     assert path == [2908399438, 7, 8, 9, 2908399438]
+
+
+def test_node_link(monkeypatch):
+    monkeypatch.setattr(osm, '_stderr_is_tty', lambda: False)
+    assert node_link(123, 'Slide') == 'node/123 (Slide)'
+
+    monkeypatch.setattr(osm, '_stderr_is_tty', lambda: True)
+    assert node_link(123) == (
+        '\x1b]8;;https://www.openstreetmap.org/node/123\x1b\\node/123\x1b]8;;\x1b\\'
+    )
+
+
+OVERPASS_RESULT = {
+    'version': 0.6,
+    'osm3s': {'timestamp_osm_base': '2024-01-01T00:00:00Z'},
+    'elements': [
+        {'type': 'node', 'id': 1, 'lat': 42.1234567, 'lon': -74.1234567},
+        {
+            'type': 'node',
+            'id': 2,
+            'lat': -1.5e-3,
+            'lon': 1e2,
+            # Brackets, braces, commas and escapes inside strings.
+            'tags': {'name': 'Slide "Mtn" ], {x}, \\ é', 'ele': '1274'},
+        },
+        {'type': 'way', 'id': 12345678901, 'nodes': [1, 2], 'tags': {}},
+        {'type': 'relation', 'id': 3, 'members': []},
+    ],
+}
+
+
+def test_iter_elements(tmp_path):
+    path = tmp_path / 'result.json'
+    path.write_text(json.dumps(OVERPASS_RESULT, indent=1))
+    expected = json.load(open(path))['elements']
+    # Tiny chunks put boundaries inside every key, string and number.
+    for chunk_size in [1, 2, 3, 7, 13, 1 << 20]:
+        assert [*iter_elements(str(path), chunk_size)] == expected, chunk_size
+
+    # Compact JSON with no whitespace between elements.
+    path.write_text(json.dumps(OVERPASS_RESULT, separators=(',', ':')))
+    for chunk_size in [1, 5, 1 << 20]:
+        assert [*iter_elements(str(path), chunk_size)] == expected, chunk_size
+
+
+def test_iter_elements_errors(tmp_path):
+    path = tmp_path / 'result.json'
+    path.write_text('{"elements": []}')
+    assert [*iter_elements(str(path), 4)] == []
+
+    path.write_text('{"remark": "runtime error"}')
+    with pytest.raises(ValueError):
+        [*iter_elements(str(path), 4)]
+
+    # Truncated inside an element, and after one.
+    for text in ['{"elements": [{"id": 1}, {"type": "no', '{"elements": [{"id": 1}']:
+        path.write_text(text)
+        with pytest.raises(ValueError):
+            [*iter_elements(str(path), 4)]
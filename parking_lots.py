@@ -15,16 +15,79 @@ Output:
 
 from collections import defaultdict
 import json
+from multiprocessing import Pool
+from pathlib import Path
 import sys
 
 import json5
 from tqdm import tqdm
 import networkx as nx
-
-from graph import get_trailhead_index, read_hiking_graph
-from osm import OsmElement, closest_point_on_trail, element_centroid, node_link
+import numpy as np
+
+from geo import distances_m, project, segment_lengths_km
+from graph import (
+    get_trailhead_index,
+    hikeable_trailheads,
+    nearest_source_labels,
+    read_hiking_graph,
+    source_path,
+)
+from osm import (
+    OsmElement,
+    closest_point_on_trail,
+    element_centroid,
+    index_way_nodes,
+    node_link,
+)
 from spec import Spec
-from util import haversine
+from util import code_digest, file_digest
+
+_walk_graph: nx.Graph | None = None
+
+
+def _init_lot_walks(road_graph: nx.Graph):
+    global _walk_graph
+    _walk_graph = road_graph
+
+
+def _lot_walks_from(args: tuple[int, list[int], float]):
+    a, others, cutoff_m = args
+    dists, paths = nx.single_source_dijkstra(
+        _walk_graph, a, cutoff=cutoff_m, weight='weight'
+    )
+    return [
+        (a, b, dists[b], paths[b]) for b in others if b in dists and dists[b] < cutoff_m
+    ]
+
+
+def find_lot_walks(road_graph: nx.Graph, lot_ids: set[int], cutoff_m: float):
+    """Find all pairs of lots within cutoff_m meters of each other by road/trail.
+
+    This runs one bounded search per lot (in a process pool) rather than an
+    unbounded search per pair. Yields (a, b, distance_m, path) with b < a.
+    """
+    tasks = [(a, [b for b in lot_ids if b < a], cutoff_m) for a in lot_ids]
+    with Pool(initializer=_init_lot_walks, initargs=(road_graph,)) as pool:
+        for walks in tqdm(pool.imap(_lot_walks_from, tasks), total=len(tasks)):
+            yield from walks
+
+
+def load_hikeable_trailheads(network_file: str, features: list) -> list[int]:
+    """hikeable_trailheads() for a network file, cached alongside it.
+
+    The cache is keyed by the network file and by the code in graph.py.
+    """
+    cache_file = Path(network_file).with_suffix('.trailheads.json')
+    digest = file_digest(network_file)
+    code = code_digest('graph.py')
+    if cache_file.exists():
+        cached = json.load(open(cache_file))
+        if cached['sha256'] == digest and cached.get('code') == code:
+            return cached['trailheads']
+    trailheads = hikeable_trailheads(read_hiking_graph(features))
+    with open(cache_file, 'w') as out:
+        json.dump({'sha256': digest, 'code': code, 'trailheads': trailheads}, out)
+    return trailheads
 
 
 def attach_parking(
@@ -34,6 +97,7 @@ def attach_parking(
     parking_elements: list[OsmElement],
     road_els: list[OsmElement],
     extra_names: list[tuple[int, str]],
+    trailheads: list[int] | None = None,
 ):
     raw_trailheads = [f for f in features if f['properties'].get('type') == 'trailhead']
     trail_ways = [el for el in raw_trails if el['type'] == 'way']
@@ -42,30 +106,14 @@ def attach_parking(
     # Found 120 trailheads
     sys.stderr.write(f'Found {len(raw_trailheads)} trailheads in network.geojson\n')
 
-    G = read_hiking_graph(features)
     id_to_trailhead = get_trailhead_index(features)
 
     id_to_extra_name = {id: name for id, name in extra_names}
 
     # We only want trailheads where you can hike from a trailhead to a high peak
     # without walking over another trailhead.
-    trailheads: list[int] = []
-    for th_node in G.nodes():
-        if G.nodes[th_node]['type'] != 'trailhead':
-            continue
-
-        node_to_length, node_to_path = nx.single_source_dijkstra(G, th_node)
-        reachable_nodes = [
-            n
-            for n in node_to_length.keys()
-            if G.nodes[n]['type'] == 'high-peak'
-            and not any(
-                G.nodes[k]['type'] == 'trailhead' for k in node_to_path[n][1:-1]
-            )
-        ]
-
-        if reachable_nodes:
-            trailheads.append(th_node)
+    if trailheads is None:
+        trailheads = hikeable_trailheads(read_hiking_graph(features))
 
     # After filtering: 76
     sys.stderr.write(f'After filtering: {len(trailheads)}\n')
@@ -102,18 +150,23 @@ def attach_parking(
     # Make a combined road/trail graph
     road_graph = nx.Graph()
     walkable_ways = road_ways + trail_ways
+    walkable_nodes = [
+        id_to_walkable_node[n] for way in walkable_ways for n in way['nodes']
+    ]
+    segment_km = segment_lengths_km(
+        [n['lon'] for n in walkable_nodes], [n['lat'] for n in walkable_nodes]
+    )
+    segment_m = (1000 * segment_km).tolist()
+    start = 0
     for way in tqdm(walkable_ways):
         way_id = way['id']
         node_ids = way['nodes']
-        nodes = [id_to_walkable_node[n] for n in node_ids]
-
-        for a, b in zip(nodes[:-1], nodes[1:]):
-            road_graph.add_edge(
-                a['id'],
-                b['id'],
-                way_id=way_id,
-                weight=1000 * haversine(a['lon'], a['lat'], b['lon'], b['lat']),
-            )
+        end = start + len(node_ids)
+        road_graph.add_edges_from(
+            (a, b, {'way_id': way_id, 'weight': d})
+            for a, b, d in zip(node_ids[:-1], node_ids[1:], segment_m[start : end - 1])
+        )
+        start = end
 
     # Add parking lots to the graph.
     # For parking lots that are ways,
@@ -122,14 +175,18 @@ def attach_parking(
     # If any node is already in the graph, it's connected and we're done.
     # If not, find the closest walkable node for each lot node.
     # This only needs to be done for lots with a centroid within 1km of a trailhead
+    walkable_index = index_way_nodes(
+        walkable_ways, id_to_walkable_node, projection=spec.projection
+    )
+    th_lons, th_lats = np.array(
+        [t['geometry']['coordinates'] for t in trailhead_features]
+    ).T
+    th_xy = project(spec.projection, th_lons, th_lats)
     hiking_lot_ids = set()
     for el in tqdm(lots):
         lot_loc = element_centroid(el, lot_nodes)
-        d = min(
-            haversine(*lot_loc, *t['geometry']['coordinates'])
-            for t in trailhead_features
-        )
-        if d > 1:
+        d = distances_m(th_xy, *spec.projection.xy(*lot_loc)).min()
+        if d > 1000:
             # sys.stderr.write(f'Skipping lot {element_link(el)} @ {d:.2f} km\n')
             continue
         # sys.stderr.write(f'Lot {element_link(el)}\n')
@@ -150,7 +207,7 @@ def attach_parking(
             # for each node, find the closest point and add a connection.
             for node in nodes:
                 d, graph_node = closest_point_on_trail(
-                    (node['lon'], node['lat']), walkable_ways, id_to_walkable_node
+                    (node['lon'], node['lat']), walkable_index
                 )
                 # sys.stderr.write(f'{element_link(node)} to {element_link(graph_node)} @ {d:.0f}m\n')
                 road_graph.add_edge(node['id'], graph_node['id'], weight=d)
@@ -167,29 +224,27 @@ def attach_parking(
     sys.stderr.write(f'Found {len(hiking_lot_ids)} hiking lots.\n')
 
     # How many trailheads have a nearby parking lot?
+    # A single search from all the hiking lots finds the closest one to each trailhead.
+    lot_labels = nearest_source_labels(
+        road_graph,
+        [lot_id for lot_id in hiking_lot_ids if road_graph.has_node(lot_id)],
+        cutoff=1600,
+    )
     num_matched, num_unmatched = 0, 0
     matched_lots = set()
     lot_fs = []
     for trailhead_id in trailheads:
         th = id_to_trailhead[trailhead_id]
-        distances = nx.single_source_dijkstra_path_length(
-            road_graph, trailhead_id, weight='weight', cutoff=1600
-        )
-        nearby_lots = [(d, id) for id, d in distances.items() if id in hiking_lot_ids]
-        nearby_lots.sort()
+        nearby_lot = lot_labels.get(trailhead_id)
 
         th_txt = node_link(trailhead_id, th['properties'].get('name'))
-        if nearby_lots:
-            print(th_txt)
+        if nearby_lot:
+            sys.stderr.write(f'{th_txt}\n')
             num_matched += 1
-            lot_distance_m, lot_id = nearby_lots[0]
-            lot = next(
-                lot for lot in lots if lot['id'] == lot_id
-            )  # could be node or way
-
-            lot_trailhead_path = nx.shortest_path(
-                road_graph, lot_id, trailhead_id, weight='weight'
-            )
+            lot_distance_m, lot_id, _pred = nearby_lot
+            lot = id_to_lot[lot_id]  # could be node or way
+
+            lot_trailhead_path = source_path(lot_labels, trailhead_id)
             sys.stderr.write(f'  lot/th walking distance: {lot_distance_m:.2f} m\n')
             is_truncated = False
             if lot['type'] == 'way' and lot_trailhead_path[0] == lot['id']:
@@ -241,7 +296,7 @@ def attach_parking(
     sys.stderr.write('\n')
 
     for lot_id in matched_lots:
-        lot = next(lot for lot in lots if lot['id'] == lot_id)  # could be node or way
+        lot = id_to_lot[lot_id]  # could be node or way
         lot_name = id_to_extra_name.get(lot_id)
         if lot_name:
             del id_to_extra_name[lot_id]
@@ -266,46 +321,39 @@ def attach_parking(
         sys.stderr.write(f'Unclaimed lot names, may be outdated: {id_to_extra_name}\n')
 
     lot_lot_paths = 0
-    for a in tqdm(matched_lots):
-        for b in matched_lots:
-            if b >= a:
-                continue
-            lot_lot_d = nx.shortest_path_length(road_graph, a, b, weight='weight')
-            if lot_lot_d < 5000:
-                d_km = lot_lot_d / 1000
-                path = nx.shortest_path(road_graph, a, b, weight='weight')
-                nodes_on_path = len([n for n in path if n not in id_to_road_node])
-                if nodes_on_path > 0.5 * len(path):
-                    sys.stderr.write(f'Tossing out {a} -> {b} as more of a hike.\n')
-                    continue
-                lot_lot_paths += 1
-                lot_fs.append(
-                    {
-                        'type': 'Feature',
-                        'geometry': {
-                            'type': 'LineString',
-                            'coordinates': [
-                                (
-                                    (node['lon'], node['lat'])
-                                    if node
-                                    else element_centroid(id_to_lot[node_id], lot_nodes)
-                                )
-                                for node_id, node in (
-                                    (node, id_to_walkable_node.get(node))
-                                    for node in path
-                                )
-                            ],
-                        },
-                        'properties': {
-                            'type': 'lot-to-lot',
-                            'from': a,
-                            'to': b,
-                            'd_km': round(d_km, 2),
-                            'd_mi': round(d_km * 0.621371, 2),
-                            'nodes': path,
-                        },
-                    }
-                )
+    for a, b, lot_lot_d, path in find_lot_walks(road_graph, matched_lots, 5000):
+        d_km = lot_lot_d / 1000
+        nodes_on_path = len([n for n in path if n not in id_to_road_node])
+        if nodes_on_path > 0.5 * len(path):
+            sys.stderr.write(f'Tossing out {a} -> {b} as more of a hike.\n')
+            continue
+        lot_lot_paths += 1
+        lot_fs.append(
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [
+                        (
+                            (node['lon'], node['lat'])
+                            if node
+                            else element_centroid(id_to_lot[node_id], lot_nodes)
+                        )
+                        for node_id, node in (
+                            (node, id_to_walkable_node.get(node)) for node in path
+                        )
+                    ],
+                },
+                'properties': {
+                    'type': 'lot-to-lot',
+                    'from': a,
+                    'to': b,
+                    'd_km': round(d_km, 2),
+                    'd_mi': round(d_km * 0.621371, 2),
+                    'nodes': path,
+                },
+            }
+        )
 
     # Added 31 lot<->lot paths.
     sys.stderr.write(f'Added {lot_lot_paths} lot<->lot paths.\n')
@@ -332,7 +380,11 @@ if __name__ == '__main__':
     parking = json.load(open(parking_file))['elements']
     extra_lot_names = json.load(open(extra_names_file))
 
-    lot_fs = attach_parking(spec, features, trails, parking, roads, extra_lot_names)
+    trailheads = load_hikeable_trailheads(network_file, features)
+
+    lot_fs = attach_parking(
+        spec, features, trails, parking, roads, extra_lot_names, trailheads
+    )
 
     with open(out_connections, 'w') as out:
         json.dump({'type': 'FeatureCollection', 'features': lot_fs}, out)
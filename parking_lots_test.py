@@ -0,0 +1,39 @@
+import random
+
+import networkx as nx
+from pytest import approx
+
+from parking_lots import find_lot_walks
+
+
+def serial_lot_walks(road_graph, lot_ids, cutoff_m):
+    """The one-search-per-pair loop that find_lot_walks replaced."""
+    for a in lot_ids:
+        for b in lot_ids:
+            if b >= a or not nx.has_path(road_graph, a, b):
+                continue
+            d = nx.shortest_path_length(road_graph, a, b, weight='weight')
+            if d < cutoff_m:
+                yield a, b, d, nx.shortest_path(road_graph, a, b, weight='weight')
+
+
+def test_find_lot_walks_matches_serial():
+    rng = random.Random(1)
+    # A 12x12 street grid with blocks of 100-300m and a couple of missing streets.
+    road_graph = nx.grid_2d_graph(12, 12)
+    road_graph.remove_edges_from([((5, y), (6, y)) for y in range(12) if y != 3])
+    road_graph = nx.convert_node_labels_to_integers(road_graph)
+    road_graph.add_node(1000)  # A lot that isn't on the grid.
+    for a, b in road_graph.edges():
+        road_graph.edges[a, b]['weight'] = rng.uniform(100, 300)
+    lot_ids = {*rng.sample(range(144), 15), 1000}
+
+    walks = [*find_lot_walks(road_graph, lot_ids, 1500)]
+    expected = [*serial_lot_walks(road_graph, lot_ids, 1500)]
+    assert walks
+    assert [(a, b) for a, b, _d, _path in walks] == [
+        (a, b) for a, b, _d, _path in expected
+    ]
+    for (_a, _b, d, path), (_, _, expected_d, expected_path) in zip(walks, expected):
+        assert d == approx(expected_d)
+        assert path == expected_path
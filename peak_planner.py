@@ -2,48 +2,64 @@
 
 Sample invocation:
 
-    poetry run python peak_planner.py H,BD,TC,C,Pl,Su,W,SW,KHP,Tw,IH,WHP
+    poetry run python peak_planner.py \\
+        data/catskills/{network-relabeled.geojson,hikes+ele.json} \\
+        H,BD,TC,C,Pl,Su,W,SW,KHP,Tw,IH,WHP
+
+Peak codes are the ones assigned by filter_to_peak_list.py. The solutions are
+written next to the hikes file.
 """
 
 import json
+import os
 import sys
 
-from osm import PEAKS
+from graph import read_hiking_graph
 from subset_cover import find_optimal_hikes_subset_cover
 
 if __name__ == '__main__':
-    features = json.load(open('data/network+parking.geojson'))['features']
-    all_hikes: list[tuple[float, list[int]]] = json.load(open('data/hikes.json'))
+    network_file, hikes_file, peaks_to_hike = sys.argv[1:]
+    out_dir = os.path.dirname(hikes_file)
+    features = json.load(open(network_file))['features']
+    G = read_hiking_graph(features)
+    all_hikes: list[tuple[float, float, list[int]]] = json.load(open(hikes_file))
 
-    (peaks_to_hike,) = sys.argv[1:]
-    ha_code_to_osm_id = {ha_code: osm_id for ha_code, osm_id, _name in PEAKS}
-    osm_ids = [ha_code_to_osm_id[ha_code] for ha_code in peaks_to_hike.split(',')]
+    code_to_id = {
+        f['properties']['code']: f['properties']['id']
+        for f in features
+        if f['properties'].get('type') == 'high-peak'
+    }
+    osm_ids = [code_to_id[code] for code in peaks_to_hike.split(',')]
     print(osm_ids)
 
     osm_ids_set = set(osm_ids)
     relevant_hikes = [
-        h for h in all_hikes if any(peak_id in osm_ids_set for peak_id in h[1])
+        h for h in all_hikes if any(peak_id in osm_ids_set for peak_id in h[2])
     ]
 
     covered_ids = set()
     for h in relevant_hikes:
-        covered_ids.update(h[1])
+        covered_ids.update(h[2])
     missing = osm_ids_set.difference(covered_ids)
     if missing:
         print('Missing', missing)
 
     print(f'Unrestricted hikes: {len(relevant_hikes)}')
     d_km, chosen, fc = find_optimal_hikes_subset_cover(
-        features, relevant_hikes, osm_ids
+        features, relevant_hikes, osm_ids, G=G
     )
     print(f'  {len(chosen)} hikes: {d_km:.2f} km = {d_km * 0.621371:.2f} mi')
-    with open('data/peak-planner.geojson', 'w') as out:
+    with open(os.path.join(out_dir, 'peak-planner.geojson'), 'w') as out:
         json.dump(fc, out)
 
     print()
-    loop_hikes = [(d, nodes) for d, nodes in relevant_hikes if nodes[0] == nodes[-1]]
+    loop_hikes = [
+        (d, ele, nodes) for d, ele, nodes in relevant_hikes if nodes[0] == nodes[-1]
+    ]
     print(f'Loop hikes: {len(loop_hikes)}')
-    d_km, chosen, fc = find_optimal_hikes_subset_cover(features, loop_hikes, osm_ids)
+    d_km, chosen, fc = find_optimal_hikes_subset_cover(
+        features, loop_hikes, osm_ids, G=G
+    )
     print(f'  {len(chosen)} hikes: {d_km:.2f} km = {d_km * 0.621371:.2f} mi')
-    with open('data/peak-planner-loops-only.geojson', 'w') as out:
+    with open(os.path.join(out_dir, 'peak-planner-loops-only.geojson'), 'w') as out:
         json.dump(fc, out)
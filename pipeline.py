@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+"""Run the data pipeline, skipping stages whose outputs are up to date.
+
+Usage: pipeline.py [--dry-run] [--force] [--only] [-j N] [target ...]
+
+A target is a region ("catskills"), a stage ("catskills/loops") or omitted to
+run everything. Each stage declares its input and output files. A stage's
+digest hashes its command, the contents of its inputs and the source of its
+script (plus any modules in this repo that it imports). Outputs are stored in
+a content-addressed cache under that digest, so a stage re-runs only when
+something it depends on has changed, and changing it back is just a copy.
+Stages whose inputs are ready run in parallel.
+
+The regions are listed in regions.json5. The Overpass results (trails.json,
+roads.json, ...) are source inputs; refresh them with run_overpass_query.py.
+"""
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from glob import glob
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+
+import json5
+
+from util import code_digest
+
+ROOT = Path(__file__).parent
+CACHE_DIR = ROOT / '.pipeline-cache'
+
+
+@dataclass
+class Stage:
+    name: str
+    cmd: list[str]
+    inputs: list[str]
+    outputs: list[str]
+    # If set, the command's stdout is written to this output.
+    stdout: str | None = None
+
+
+REGIONS_FILE = 'regions.json5'
+COVERS = [
+    'loops-only',
+    'day-hikes-only',
+    'day-loop-hikes-only',
+    'prefer-loop-hikes',
+    'day-prefer-loop-hikes',
+    'unrestricted',
+]
+
+
+def side_file(path: str, suffix: str) -> str:
+    """A file that a script writes next to path, e.g. loops.py's cluster cache."""
+    return str(Path(path).with_suffix(suffix))
+
+
+def region_stages(region: str, config: dict) -> list[Stage]:
+    """The stages from "Data ingestion flow" in the README for one region."""
+    d = f'data/{region}'
+    trails = (
+        f'{d}/combined-trails.json' if config['augment_trails'] else f'{d}/trails.json'
+    )
+    peak_list = f'{d}/{config["peak_list"]}'
+    spec = f'{d}/spec.json5'
+    stages = []
+
+    def add(step: str, cmd: list[str], inputs, outputs, stdout=None):
+        stages.append(Stage(f'{region}/{step}', cmd, inputs, outputs, stdout))
+
+    if config['augment_trails']:
+        extra_trails = sorted(glob(f'{d}/additional-trails/*.geojson'))
+        add(
+            'augment_trails',
+            ['augment_trails.py', d],
+            [spec, f'{d}/trails.json', f'{d}/roads.json', *extra_trails],
+            [f'{d}/additional-trails.json', trails],
+        )
+    peak_codes = f'{d}/peak-codes-gnis.txt'
+    add(
+        'filter_to_peak_list',
+        ['filter_to_peak_list.py', f'{d}/peaks.json', peak_codes],
+        [f'{d}/peaks.json', peak_codes],
+        [peak_list],
+        stdout=peak_list,
+    )
+    peaks_connected = f'{d}/peaks-connected.json'
+    add(
+        'shift_peaks',
+        ['shift_peaks.py', spec, peak_list, trails],
+        [spec, peak_list, trails],
+        [peaks_connected],
+        stdout=peaks_connected,
+    )
+    network = f'{d}/network.geojson'
+    roads = f'{d}/roads.json'
+    add(
+        'extract_network',
+        ['extract_network.py', spec, peaks_connected, trails, roads],
+        [spec, peaks_connected, trails, roads],
+        [network],
+        stdout=network,
+    )
+    parking_inputs = [
+        spec,
+        network,
+        trails,
+        roads,
+        f'{d}/parking.json',
+        f'{d}/extra-lot-names.json',
+    ]
+    connections = f'{d}/parking-connections.geojson'
+    network_parking = f'{d}/network+parking.geojson'
+    add(
+        'parking_lots',
+        ['parking_lots.py', *parking_inputs, connections, network_parking],
+        parking_inputs,
+        # parking_lots.py also caches the trailheads next to the network.
+        [connections, network_parking, side_file(network, '.trailheads.json')],
+    )
+    dem = f'{d}/ele.tif'
+    bounds = [str(x) for x in config['dem_bounds']]
+    add('dem', ['eio', 'clip', '-o', dem, '--bounds', *bounds], [], [dem])
+    network_ele = f'{d}/network+parking+ele.geojson'
+    # The previous output lets elevation.py skip features that haven't changed.
+    add(
+        'elevation',
+        ['elevation.py', network_parking, dem, network_ele],
+        [network_parking, dem],
+        [network_ele],
+        stdout=network_ele,
+    )
+    # loops.py runs twice: once to find out which nodes are used most often (so
+    # that they get the smallest IDs) and again with the relabeled network.
+    first_hikes = f'{d}/hikes-before-relabel.json'
+    add(
+        'loops_before_relabel',
+        ['loops.py', spec, network_ele],
+        [spec, network_ele],
+        [first_hikes, side_file(network_ele, '.loops-cache.json')],
+        stdout=first_hikes,
+    )
+    relabeled = f'{d}/network-relabeled.geojson'
+    add(
+        'relabel_network',
+        ['relabel_network.py', network_ele, first_hikes],
+        [network_ele, first_hikes],
+        [relabeled],
+        stdout=relabeled,
+    )
+    hikes = f'{d}/hikes.json'
+    add(
+        'loops',
+        ['loops.py', spec, relabeled],
+        [spec, relabeled],
+        [hikes, side_file(relabeled, '.loops-cache.json')],
+        stdout=hikes,
+    )
+    hikes_ele = f'{d}/hikes+ele.json'
+    add(
+        'add_elevation_to_hikes',
+        ['add_elevation_to_hikes.py', relabeled, hikes],
+        [relabeled, hikes],
+        [hikes_ele],
+        stdout=hikes_ele,
+    )
+    cover = config['cover']
+    add(
+        'subset_cover',
+        [
+            'all_hikes_subset_cover.py',
+            relabeled,
+            hikes_ele,
+            str(cover['max_day_hike_mi']),
+            str(cover['max_iters']),
+            f'{d}/hikes',
+        ],
+        [relabeled, hikes_ele],
+        [f'{d}/hikes/{name}.geojson' for name in COVERS],
+    )
+    return stages
+
+
+def all_stages(regions: dict[str, dict]) -> list[Stage]:
+    """Stages for every region, plus one to build an index of their outputs."""
+    stages = [
+        stage
+        for region, config in regions.items()
+        for stage in region_stages(region, config)
+    ]
+    index_inputs = [
+        path
+        for stage in stages
+        if stage.name.endswith('/subset_cover')
+        for path in stage.inputs + stage.outputs
+    ]
+    stages.append(
+        Stage(
+            'index',
+            ['region_index.py', REGIONS_FILE],
+            [REGIONS_FILE, *index_inputs],
+            ['data/index.json'],
+            stdout='data/index.json',
+        )
+    )
+    return stages
+
+
+def file_sha256(path: str) -> str:
+    with open(ROOT / path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def stage_digest(stage: Stage) -> str:
+    h = hashlib.sha256(json.dumps(stage.cmd).encode())
+    if stage.cmd[0].endswith('.py'):
+        h.update(code_digest(stage.cmd[0], str(ROOT)).encode())
+    for path in stage.inputs:
+        h.update(f'{path}:{file_sha256(path)}'.encode())
+    return h.hexdigest()
+
+
+def restore_outputs(stage: Stage, digest: str) -> bool:
+    """Copy a stage's outputs from the cache, if they're there."""
+    cached = CACHE_DIR / digest
+    if not all((cached / Path(out).name).exists() for out in stage.outputs):
+        return False
+    for out in stage.outputs:
+        cached_file = cached / Path(out).name
+        if not (ROOT / out).exists() or file_sha256(out) != file_sha256(cached_file):
+            shutil.copyfile(cached_file, ROOT / out)
+    return True
+
+
+def run_stage(stage: Stage, digest: str):
+    """Run a stage's command and store its outputs in the cache."""
+    cmd = stage.cmd
+    if cmd[0].endswith('.py'):
+        cmd = [sys.executable, *cmd]
+    log_file = CACHE_DIR / 'logs' / f'{stage.name.replace("/", "-")}.log'
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    stdout_file = ROOT / stage.stdout if stage.stdout else None
+    # Stdout goes to a temporary file until the stage succeeds, so that the
+    # command can read the previous version of its output (see elevation.py).
+    tmp_file = stdout_file.with_name(stdout_file.name + '.tmp') if stdout_file else None
+    with open(log_file, 'w') as log:
+        stdout = open(tmp_file, 'w') if tmp_file else log
+        try:
+            result = subprocess.run(cmd, cwd=ROOT, stdout=stdout, stderr=log)
+        finally:
+            if tmp_file:
+                stdout.close()
+    if tmp_file:
+        if result.returncode == 0:
+            os.replace(tmp_file, stdout_file)
+        else:
+            tmp_file.unlink()
+    if result.returncode != 0:
+        raise RuntimeError(
+            f'{stage.name} failed with exit code {result.returncode}; see {log_file}'
+        )
+    cached = CACHE_DIR / digest
+    cached.mkdir(parents=True, exist_ok=True)
+    for out in stage.outputs:
+        shutil.copyfile(ROOT / out, cached / Path(out).name)
+
+
+def select_stages(stages: list[Stage], targets: list[str], only=False) -> list[Stage]:
+    """The stages matching these targets, plus (unless only) their dependencies."""
+    if not targets:
+        return stages
+    producer = {out: stage for stage in stages for out in stage.outputs}
+    selected: dict[str, Stage] = {}
+
+    def visit(stage: Stage):
+        if stage.name in selected:
+            return
+        for path in stage.inputs:
+            if path in producer and not only:
+                visit(producer[path])
+        selected[stage.name] = stage
+
+    for target in targets:
+        matches = [s for s in stages if target in (s.name, s.name.split('/')[0])]
+        if not matches:
+            raise ValueError(f'Unknown target {target}')
+        for stage in matches:
+            visit(stage)
+    return [s for s in stages if s.name in selected]
+
+
+def run_pipeline(stages: list[Stage], jobs: int, force=False, dry_run=False):
+    producer = {out: stage.name for stage in stages for out in stage.outputs}
+    pending = {stage.name: stage for stage in stages}
+    done: set[str] = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if len(running) >= jobs:
+                    break
+                deps = {producer[p] for p in stage.inputs if p in producer}
+                if not deps <= done:
+                    continue
+                del pending[name]
+                missing = [p for p in stage.inputs if not (ROOT / p).exists()]
+                if missing and not dry_run:
+                    raise FileNotFoundError(f'{name} is missing inputs: {missing}')
+                if dry_run:
+                    print(f'{name}: {" ".join(stage.cmd)}')
+                    done.add(name)
+                    continue
+                digest = stage_digest(stage)
+                if not force and restore_outputs(stage, digest):
+                    print(f'{name}: up to date')
+                    done.add(name)
+                    continue
+                print(f'{name}: running {" ".join(stage.cmd)}')
+                running[pool.submit(run_stage, stage, digest)] = name
+            if not running:
+                if pending:
+                    raise ValueError(f'Unable to schedule {[*pending]}')
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                print(f'{name}: done')
+                done.add(name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('targets', nargs='*', help='regions or region/stage names')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help='re-run every stage')
+    parser.add_argument(
+        '--only',
+        action='store_true',
+        help="don't run the stages that the targets depend on",
+    )
+    parser.add_argument(
+        '--dry-run', action='store_true', help='list the stages that would run'
+    )
+    args = parser.parse_args()
+    regions = json5.load(open(ROOT / REGIONS_FILE))
+    run_pipeline(
+        select_stages(all_stages(regions), args.targets, args.only),
+        jobs=args.jobs,
+        force=args.force,
+        dry_run=args.dry_run,
+    )
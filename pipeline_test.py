@@ -0,0 +1,65 @@
+import pipeline
+from pipeline import Stage, run_pipeline, select_stages
+
+
+def test_run_pipeline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(pipeline, 'ROOT', tmp_path)
+    monkeypatch.setattr(pipeline, 'CACHE_DIR', tmp_path / 'cache')
+    stages = [
+        Stage('r/copy', ['cp', 'a.txt', 'b.txt'], ['a.txt'], ['b.txt']),
+        Stage('r/cat', ['cat', 'b.txt', 'b.txt'], ['b.txt'], ['c.txt'], 'c.txt'),
+        Stage('r/other', ['cp', 'x.txt', 'y.txt'], ['x.txt'], ['y.txt']),
+    ]
+    assert [s.name for s in select_stages(stages, ['r/cat'])] == ['r/copy', 'r/cat']
+    assert [s.name for s in select_stages(stages, ['r/cat'], only=True)] == ['r/cat']
+
+    (tmp_path / 'a.txt').write_text('1\n')
+    (tmp_path / 'x.txt').write_text('x\n')
+    run_pipeline(stages, jobs=2)
+    assert (tmp_path / 'c.txt').read_text() == '1\n1\n'
+    assert capsys.readouterr().out.count(': running') == 3
+
+    run_pipeline(stages, jobs=2)
+    assert capsys.readouterr().out.count(': up to date') == 3
+
+    (tmp_path / 'a.txt').write_text('2\n')
+    run_pipeline(stages, jobs=2)
+    out = capsys.readouterr().out
+    assert 'r/copy: running' in out and 'r/cat: running' in out
+    assert 'r/other: up to date' in out
+    assert (tmp_path / 'c.txt').read_text() == '2\n2\n'
+
+    # Reverting an input restores the earlier outputs from the cache.
+    (tmp_path / 'a.txt').write_text('1\n')
+    run_pipeline(stages, jobs=2)
+    assert capsys.readouterr().out.count(': up to date') == 3
+    assert (tmp_path / 'c.txt').read_text() == '1\n1\n'
+
+
+def test_stage_reads_previous_output(tmp_path, monkeypatch):
+    # A stage can pass its own stdout file as an input; it sees the previous
+    # version rather than an empty file.
+    monkeypatch.setattr(pipeline, 'ROOT', tmp_path)
+    monkeypatch.setattr(pipeline, 'CACHE_DIR', tmp_path / 'cache')
+    cmd = ['sh', '-c', 'cat out.txt 2>/dev/null; cat a.txt']
+    stages = [Stage('r/append', cmd, ['a.txt'], ['out.txt'], 'out.txt')]
+    (tmp_path / 'a.txt').write_text('1\n')
+    run_pipeline(stages, jobs=1)
+    (tmp_path / 'a.txt').write_text('2\n')
+    run_pipeline(stages, jobs=1)
+    assert (tmp_path / 'out.txt').read_text() == '1\n2\n'
+    assert not (tmp_path / 'out.txt.tmp').exists()
+
+
+def test_region_stages_declare_side_files():
+    # Caches that scripts write next to their inputs are declared as outputs.
+    config = {'augment_trails': False, 'peak_list': 'peaks.json', 'dem_bounds': []}
+    config['cover'] = {'max_day_hike_mi': 20, 'max_iters': 10}
+    outputs = {
+        out for stage in pipeline.region_stages('r', config) for out in stage.outputs
+    }
+    assert {
+        'data/r/network.trailheads.json',
+        'data/r/network+parking+ele.loops-cache.json',
+        'data/r/network-relabeled.loops-cache.json',
+    } <= outputs
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Summarize the outputs of every region in regions.json5 as one JSON index.
+
+Usage: region_index.py regions.json5 > data/index.json
+"""
+
+import json
+import sys
+
+import json5
+
+from pipeline import COVERS
+
+
+def region_summary(region: str) -> dict:
+    d = f'data/{region}'
+    features = json.load(open(f'{d}/network-relabeled.geojson'))['features']
+    hikes = json.load(open(f'{d}/hikes+ele.json'))
+    covers = {}
+    for name in COVERS:
+        path = f'{d}/hikes/{name}.geojson'
+        hike_features = [
+            f
+            for f in json.load(open(path))['features']
+            if f['geometry']['type'] == 'MultiLineString'
+        ]
+        covers[name] = {
+            'path': path,
+            'num_hikes': len(hike_features),
+            'd_km': round(sum(f['properties']['d_km'] for f in hike_features), 2),
+        }
+    return {
+        'network': f'{d}/network-relabeled.geojson',
+        'hikes': f'{d}/hikes+ele.json',
+        'num_peaks': sum(
+            1 for f in features if f['properties'].get('type') == 'high-peak'
+        ),
+        'num_lots': sum(
+            1 for f in features if f['properties'].get('type') == 'parking-lot'
+        ),
+        'num_hikes': len(hikes),
+        'covers': covers,
+    }
+
+
+if __name__ == '__main__':
+    (regions_file,) = sys.argv[1:]
+    regions = json5.load(open(regions_file))
+    index = {region: region_summary(region) for region in regions}
+    json.dump(index, sys.stdout, indent=2)
@@ -1,33 +1,137 @@
 #!/usr/bin/env python
+"""Run Overpass queries and save the results under data/.
 
-import sys
-import json
-from pathlib import Path
-from typing import List
+Usage: run_overpass_query.py [--endpoint URL] [--offline] queries/catskills/*.txt
+
+Responses are cached by a hash of the query text in .overpass-cache/. A result
+under data/ is only rewritten if its elements changed (see osm_diff.py), so
+pipeline.py only reruns the stages that read the results that changed. Point
+--endpoint at a local Overpass instance (e.g. one loaded from a PBF extract) for
+fast, reproducible builds, or use --offline to only use cached responses.
+"""
+
+import argparse
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+from pathlib import Path
+import sys
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from osm import iter_elements
+from osm_diff import replace_if_changed
+
+OVERPASS_ENDPOINT = 'https://overpass-api.de/api/interpreter'
+CACHE_DIR = Path('.overpass-cache')
+
+
+def make_session(num_connections: int) -> requests.Session:
+    """A session with a connection pool that retries on rate limits and timeouts."""
+    retry = Retry(
+        total=5,
+        backoff_factor=5,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=None,  # Overpass queries are POSTs, but they're idempotent.
+    )
+    adapter = HTTPAdapter(pool_maxsize=num_connections, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def cache_path(query: str) -> Path:
+    return CACHE_DIR / (hashlib.sha256(query.encode()).hexdigest() + '.json')
+
+
+def fetch_to_file(session: requests.Session, endpoint: str, query: str, path: Path):
+    """Stream the response to a query to disk."""
+    tmp_path = path.with_suffix('.tmp')
+    with session.post(endpoint, data={'data': query}, stream=True) as r:
+        r.raise_for_status()
+        with open(tmp_path, 'wb') as out:
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                out.write(chunk)
+    os.replace(tmp_path, path)
+
+
+def cached_result(
+    session: requests.Session | None, endpoint: str, query: str, max_age_s: float
+) -> Path:
+    """Path to the response for this query, fetching it if necessary."""
+    path = cache_path(query)
+    if path.exists():
+        if session is None or time.time() - path.stat().st_mtime < max_age_s:
+            return path
+    if session is None:
+        raise FileNotFoundError(f'No cached result for query (expected {path})')
+    fetch_to_file(session, endpoint, query, path)
+    return path
+
 
+def element_stats(path: Path):
+    return Counter(e['type'] for e in iter_elements(str(path)))
 
-def fetch_from_overpass(query: str) -> str:
-    r = requests.post('https://overpass-api.de/api/interpreter', data={'data': query})
-    r.raise_for_status()
-    return r.text
 
+def run_query(
+    session: requests.Session | None, endpoint: str, query_file: str, max_age_s: float
+) -> str:
+    """Run one query and save its result; returns a summary for logging."""
+    p = Path(query_file).relative_to('queries')
+    query = open(query_file).read()
+    result_path = cached_result(session, endpoint, query, max_age_s)
+    out_path = Path('data') / str(p).replace('.txt', '.json')
+    lines = [f'{query_file} -> {out_path}']
+    diff = replace_if_changed(str(out_path), str(result_path))
+    if diff is not None:
+        lines.append(f'  changes since last run: {diff.summary()}')
+        if not diff:
+            lines.append('  left unchanged')
+            return '\n'.join(lines)
+    stats = element_stats(out_path)
+    rels = stats.get('relation') or 0
+    ways = stats.get('way') or 0
+    nodes = stats.get('node') or 0
+    num_bytes = out_path.stat().st_size
+    lines.append(f'  -> {num_bytes} bytes, rel={rels}, way={ways}, node={nodes}')
+    return '\n'.join(lines)
 
-def element_stats(elements: List[any]):
-    return Counter(e['type'] for e in elements)
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('query_files', nargs='+')
+    parser.add_argument('--endpoint', default=OVERPASS_ENDPOINT)
+    parser.add_argument(
+        '--offline', action='store_true', help='only use cached responses'
+    )
+    parser.add_argument(
+        '--max-age-hours',
+        type=float,
+        default=24,
+        help='re-fetch cached responses older than this',
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=2,
+        help='concurrent queries (the public endpoint allows two per client)',
+    )
+    args = parser.parse_args()
 
-for path in sys.argv[1:]:
-    p = Path(path).relative_to('queries')
-    query = open(path).read()
-    print(f'Running query {path}')
-    result = fetch_from_overpass(query)
-    with open(Path('data') / str(p).replace('.txt', '.json'), 'w') as out:
-        out.write(result)
-        stats = element_stats(json.loads(result)['elements'])
-        rels = stats.get('relation') or 0
-        ways = stats.get('way') or 0
-        nodes = stats.get('node') or 0
-        print(f'  -> {len(result)} bytes, rel={rels}, way={ways}, node={nodes}')
+    CACHE_DIR.mkdir(exist_ok=True)
+    session = None if args.offline else make_session(args.jobs)
+    max_age_s = 3600 * args.max_age_hours
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        summaries = pool.map(
+            lambda f: run_query(session, args.endpoint, f, max_age_s),
+            args.query_files,
+        )
+        for summary in summaries:
+            print(summary)
+    sys.stdout.flush()
@@ -3,16 +3,28 @@
 
 OSM is a bit too precise about the location of peaks for our needs.
 This script shifts the peaks to use nearby nodes that are on trails.
+
+Usage: shift_peaks.py spec.json5 peaks.json trails.json > peaks-connected.json
 """
 
 import sys
 import json
 from collections import Counter, defaultdict
 
-from osm import OsmElement, OsmNode, closest_point_on_trail, element_link, way_length
+import json5
+
+from osm import (
+    OsmElement,
+    OsmNode,
+    closest_point_on_trail,
+    element_link,
+    index_way_nodes,
+    way_length,
+)
+from spec import Spec
 
 
-def shift_peaks(peaks_file: str, trails_file: str):
+def shift_peaks(spec: Spec, peaks_file: str, trails_file: str):
     peak_nodes: list[OsmNode] = json.load(open(peaks_file))['elements']
 
     trail_elements: list[OsmElement] = json.load(open(trails_file))['elements']
@@ -46,6 +58,7 @@ def shift_peaks(peaks_file: str, trails_file: str):
 
     sys.stderr.write(f'Dropped {num_dropped} short spur ways.\n')
     trail_ways = new_ways
+    trail_index = index_way_nodes(trail_ways, trail_nodes, projection=spec.projection)
 
     on_trail = 0
     farthest = 0
@@ -70,9 +83,7 @@ def shift_peaks(peaks_file: str, trails_file: str):
             new_peaks.append(peak)
             continue
 
-        pt_m, pt_node = closest_point_on_trail(
-            (peak['lon'], peak['lat']), trail_ways, trail_nodes
-        )
+        pt_m, pt_node = closest_point_on_trail((peak['lon'], peak['lat']), trail_index)
         farthest = max(pt_m, farthest)
 
         # The Mill Brook Ridge peak node is 52.6m from the trail.
@@ -108,10 +119,11 @@ def shift_peaks(peaks_file: str, trails_file: str):
 
 
 if __name__ == '__main__':
-    peaks_file, trails_file = sys.argv[1:]
+    spec_file, peaks_file, trails_file = sys.argv[1:]
     # peaks_file = 'data/peaks-3500.json'
     # trails_file = 'data/combined-trails.json'
-    new_peaks = shift_peaks(peaks_file, trails_file)
+    spec = Spec(json5.load(open(spec_file)))
+    new_peaks = shift_peaks(spec, peaks_file, trails_file)
     json.dump(
         {
             'elements': new_peaks,
@@ -0,0 +1,125 @@
+"""Uniform grid index for nearest-neighbor queries over (lon, lat) points."""
+
+import heapq
+import math
+from typing import Callable, Generic, Iterator, TypeVar
+
+from util import LocalProjection
+
+T = TypeVar('T')
+
+
+class GridIndex(Generic[T]):
+    """Bucket points into square cells so that queries only scan nearby cells.
+
+    Points are projected to meters with a LocalProjection when they're
+    inserted, so cells are square and distances are Euclidean in that plane.
+    Use one centered on the data, e.g. Spec.projection. Points can be inserted
+    at any time.
+    """
+
+    def __init__(self, projection: LocalProjection, cell_m: float = 250):
+        self.cell_m = cell_m
+        self.projection = projection
+        self.cells: dict[tuple[int, int], list[tuple[float, float, T]]] = {}
+        self.min_cell: tuple[int, int] | None = None
+        self.max_cell: tuple[int, int] | None = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def cell(self, x: float, y: float) -> tuple[int, int]:
+        return math.floor(x / self.cell_m), math.floor(y / self.cell_m)
+
+    def insert(self, lon: float, lat: float, item: T):
+        x, y = self.projection.xy(lon, lat)
+        key = self.cell(x, y)
+        self.cells.setdefault(key, []).append((x, y, item))
+        self.size += 1
+        if self.min_cell is None:
+            self.min_cell = self.max_cell = key
+        else:
+            self.min_cell = (
+                min(self.min_cell[0], key[0]),
+                min(self.min_cell[1], key[1]),
+            )
+            self.max_cell = (
+                max(self.max_cell[0], key[0]),
+                max(self.max_cell[1], key[1]),
+            )
+
+    def _rings(self, x: float, y: float) -> Iterator[tuple[int, list]]:
+        """Yield (r, points) for successive square rings of cells around a point.
+
+        Any point outside rings 0..r is at least r * cell_m away.
+        """
+        if self.min_cell is None:
+            return
+        cx, cy = self.cell(x, y)
+        max_r = max(
+            abs(cx - self.min_cell[0]),
+            abs(cx - self.max_cell[0]),
+            abs(cy - self.min_cell[1]),
+            abs(cy - self.max_cell[1]),
+        )
+        for r in range(max_r + 1):
+            points = []
+            for ix in range(cx - r, cx + r + 1):
+                if r == 0 or ix in (cx - r, cx + r):
+                    iys = range(cy - r, cy + r + 1)
+                else:
+                    iys = (cy - r, cy + r)
+                for iy in iys:
+                    points += self.cells.get((ix, iy), ())
+            yield r, points
+
+    def k_nearest(
+        self,
+        lon_lat: tuple[float, float],
+        k: int,
+        predicate: Callable[[T], bool] | None = None,
+    ) -> list[tuple[float, T]]:
+        """Find the k closest items (that satisfy predicate), as (meters, item)."""
+        x1, y1 = self.projection.xy(*lon_lat)
+        # max-heap via negated distances; the counter breaks ties between items.
+        best: list[tuple[float, int, T]] = []
+        counter = 0
+        for r, points in self._rings(x1, y1):
+            for x2, y2, item in points:
+                if predicate and not predicate(item):
+                    continue
+                d = math.hypot(x2 - x1, y2 - y1)
+                counter += 1
+                entry = (-d, counter, item)
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif d < -best[0][0]:
+                    heapq.heapreplace(best, entry)
+            if len(best) == k and -best[0][0] <= r * self.cell_m:
+                break
+        return sorted(((-d, item) for d, _, item in best), key=lambda x: x[0])
+
+    def nearest(
+        self,
+        lon_lat: tuple[float, float],
+        predicate: Callable[[T], bool] | None = None,
+    ) -> tuple[float, T | None]:
+        """Find the closest item (that satisfies predicate), as (meters, item)."""
+        hits = self.k_nearest(lon_lat, 1, predicate)
+        return hits[0] if hits else (math.inf, None)
+
+    def within(
+        self, lon_lat: tuple[float, float], radius_m: float
+    ) -> list[tuple[float, T]]:
+        """Find all items within radius_m meters, as (meters, item)."""
+        x1, y1 = self.projection.xy(*lon_lat)
+        hits = []
+        for r, points in self._rings(x1, y1):
+            if (r - 1) * self.cell_m > radius_m:
+                break
+            for x2, y2, item in points:
+                d = math.hypot(x2 - x1, y2 - y1)
+                if d <= radius_m:
+                    hits.append((d, item))
+        return hits
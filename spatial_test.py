@@ -0,0 +1,46 @@
+import random
+
+from spatial import GridIndex
+from util import LocalProjection
+
+projection = LocalProjection.for_bbox(41.9, 42.3, -74.6, -74.0)
+
+
+def brute_force(points, lon_lat):
+    return sorted(
+        (projection.distance_m(*lon_lat, lon, lat), i)
+        for i, (lon, lat) in enumerate(points)
+    )
+
+
+def test_grid_index_matches_brute_force():
+    rng = random.Random(0)
+    points = [(rng.uniform(-74.6, -74.0), rng.uniform(41.9, 42.3)) for _ in range(2000)]
+    index = GridIndex(projection)
+    for i, (lon, lat) in enumerate(points):
+        index.insert(lon, lat, i)
+    assert len(index) == 2000
+
+    for _ in range(50):
+        # Include some query points well outside the indexed area.
+        q = (rng.uniform(-75.0, -73.6), rng.uniform(41.7, 42.5))
+        expected = brute_force(points, q)
+
+        d, i = index.nearest(q)
+        assert i == expected[0][1]
+        assert abs(d - expected[0][0]) < 1e-6
+
+        assert [i for _d, i in index.k_nearest(q, 5)] == [i for _d, i in expected[:5]]
+
+        d, i = index.nearest(q, lambda i: i % 2 == 1)
+        assert i == next(i for _d, i in expected if i % 2 == 1)
+
+        assert sorted(i for _d, i in index.within(q, 1500)) == sorted(
+            i for d, i in expected if d <= 1500
+        )
+
+
+def test_grid_index_empty():
+    index = GridIndex(projection)
+    assert index.nearest((-74.2, 42.0)) == (float('inf'), None)
+    assert index.within((-74.2, 42.0), 100) == []
@@ -1,3 +1,6 @@
+from util import LocalProjection
+
+
 class Spec:
     def __init__(self, data):
         self.data = data
@@ -6,6 +9,9 @@ class Spec:
         self.south = bbox['south']
         self.east = bbox['east']
         self.west = bbox['west']
+        self.projection = LocalProjection.for_bbox(
+            self.south, self.north, self.west, self.east
+        )
         self.num_peaks = data['num_peaks']
         self.max_peaks_per_hike = data['max_peaks_per_hike']
         self.invalid_parking_ids = set(data.get('invalid_parking_ids', []))
@@ -13,6 +19,9 @@ class Spec:
         self.edges_to_toss = [(a, b) for a, b in data.get('edges_to_toss', [])]
         self.forced_clusters = [set(x) for x in data.get('forced_clusters', [])]
         self.roads_that_are_trails = set(data.get('roads_that_are_trails', []))
+        # If set, hikes that pass within this many meters of a peak that they
+        # don't include are discarded, as though they went over it.
+        self.peak_proximity_m = data.get('peak_proximity_m')
 
     def is_in_bbox(self, lon: float, lat: float):
         return self.south <= lat <= self.north and self.west <= lon <= self.east
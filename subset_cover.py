@@ -2,26 +2,28 @@
 
 import numpy as np
 import networkx as nx
-from SetCoverPy import setcover
 
+import metrics
 from graph import get_lot_index, get_peak_index, read_hiking_graph
 from util import orient
 
 
 def find_optimal_hikes_subset_cover(
-    features: list, hikes: list, peak_osm_ids: list[int] | None = None, maxiters=20
+    features: list,
+    hikes: list,
+    peak_osm_ids: list[int] | None = None,
+    maxiters=20,
+    G: nx.Graph | None = None,
 ):
     """hikes is a list of either:
 
     - (d_km, ele_m, nodes_list)
     - (cost, ele_m, nodes_list, d_km)
     """
-    G = read_hiking_graph(features)
-    id_to_peak = get_peak_index(features)
-    id_to_lot = get_lot_index(features)
-    peak_features = [*id_to_peak.values()]
+    from SetCoverPy import setcover
+
     if not peak_osm_ids:
-        peak_osm_ids = [f['properties']['id'] for f in peak_features]
+        peak_osm_ids = [*get_peak_index(features).keys()]
     num_loops = len(hikes)
     num_peaks = len(peak_osm_ids)
     peak_id_to_idx = {osm_id: i for i, osm_id in enumerate(peak_osm_ids)}
@@ -40,20 +42,45 @@ def find_optimal_hikes_subset_cover(
     costs = costs / median_cost
 
     solver = setcover.SetCover(covers, costs, maxiters=maxiters)
-    solver.SolveSCP()
+    with metrics.span(
+        'set_cover', hikes=num_loops, peaks=num_peaks, maxiters=maxiters
+    ) as span:
+        solver.SolveSCP()
+        span['chosen'] = int(np.sum(solver.s))
     chosen_hikes = []
     for j, hike in enumerate(hikes):
         if solver.s[j]:
             chosen_hikes.append(hike)
 
+    total_d_km, fc = hikes_feature_collection(features, chosen_hikes, peak_osm_ids, G)
+    return total_d_km, chosen_hikes, fc
+
+
+def hikes_feature_collection(
+    features: list,
+    hikes: list,
+    peak_osm_ids: list[int] | None = None,
+    G: nx.Graph | None = None,
+):
+    """A GeoJSON FeatureCollection showing a set of hikes, and their total length.
+
+    hikes are in the same formats as for find_optimal_hikes_subset_cover.
+    """
+    if G is None:
+        G = read_hiking_graph(features)
+    id_to_peak = get_peak_index(features)
+    id_to_lot = get_lot_index(features)
+    peak_features = [*id_to_peak.values()]
+    peak_id_set = set(peak_osm_ids or id_to_peak.keys())
+
     total_d_km = 0
-    tsp_fs = [f for f in peak_features if f['properties']['id'] in peak_id_to_idx]
+    tsp_fs = [f for f in peak_features if f['properties']['id'] in peak_id_set]
     id_to_feature = {
         f['properties']['id']: f for f in features if 'id' in f['properties']
     }
     for f in tsp_fs:
         f['properties']['marker-size'] = 'small'
-    for i, hike in enumerate(chosen_hikes):
+    for i, hike in enumerate(hikes):
         d_km, ele_m, loop = hike[:3]
         cost = None
         if len(hike) > 3:
@@ -91,4 +118,4 @@ def find_optimal_hikes_subset_cover(
             }
         )
 
-    return total_d_km, chosen_hikes, {'type': 'FeatureCollection', 'features': tsp_fs}
+    return total_d_km, {'type': 'FeatureCollection', 'features': tsp_fs}
@@ -0,0 +1,14 @@
+from util import code_digest
+
+
+def test_code_digest_import_cycle(tmp_path):
+    (tmp_path / 'a.py').write_text('import b\nimport json\n')
+    (tmp_path / 'b.py').write_text('from a import x\n')
+    root = str(tmp_path)
+    digest = code_digest('a.py', root)
+    assert code_digest('b.py', root) == digest  # Same set of modules.
+
+    code_digest.cache_clear()
+    (tmp_path / 'b.py').write_text('from a import y\n')
+    assert code_digest('a.py', root) != digest
+    code_digest.cache_clear()